@@ -1,271 +1,2324 @@
-import pandas as pd
-from rapidfuzz import fuzz,process
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
-import numpy as np
-import re
-from io import BytesIO
-
-
-
-# Function to clean column names by removing leading and trailing spaces
-def clean_column_names(df):
-    df.columns = df.columns.str.strip()
-    return df
-
-
-# Function to standardize common street suffix abbreviations
-def standardize_address(address):
-    replacements = {
-        r'\bSt\b': 'street',
-        r'\bRd\b': 'road',
-        r'\bAve\b': 'avenue',
-        r'\bPl\b': 'place',
-        r'\bDr\b': 'drive',
-        r'\bLn\b': 'lane',
-        r'\bBlvd\b': 'boulevard',
-        r'\bCt\b': 'court',
-        r'\bAlly\b': 'alley',
-        r'\bAlwy\b': 'alleyway',
-        r'\bArc\b': 'arcade',
-        r'\bBasn\b': 'basin',
-        r'\bBch\b': 'beach',
-        r'\bBend\b': 'bend',
-        r'\bBlk\b': 'block',
-        r'\bBvd\b': 'boulevard',
-        r'\bBdge\b': 'bridge',
-        r'\bBdwy\b': 'broadway',
-        r'\bBypa\b': 'bypass',
-        r'\bBywy\b': 'byway',
-        r'\bCaus\b': 'causeway',
-        r'\bCn\b': 'central',
-        r'\bCtr\b': 'centre',
-        r'\bCnwy\b': 'centreway',
-        r'\bCh\b': 'chase',
-        r'\bCir\b': 'circle',
-        r'\bCct\b': 'circuit',
-        r'\bCl\b': 'close',
-        r'\bCon\b': 'concourse',
-        r'\bCnr\b': 'corner',
-        # Postal delivery type abbreviations
-        r'\bcare po\b': 'care Of Post Office',
-        r'\bcma\b': 'community Mail Agent',
-        r'\bcmb\b': 'community Mail Bag',
-        r'\bgpo box\b': 'general Post Office Box',
-        r'\blocked bag\b': 'locked Mail Bag Service',
-        r'\bms\b': 'mail Service',
-        r'\bpo box\b': 'post Office Box',
-        r'\bprivate bag\b': 'private mail bag service',
-        r'\brsd\b': 'roadside delivery',
-        r'\brmb\b': 'roadside mail bag',
-        r'\brms\b': 'roadside mail service',
-        r'\bcpa\b': 'community postal agent',
-        r'\bstrp\b': 'strip',
-        r'\bsbwy\b': 'subway',
-        r'\bthor\b': 'thoroughfare',
-        r'\btlwy\b': 'tollway',
-        r'\btwrs\b': 'towers',
-        r'\btrk\b': 'track',
-        r'\btrlr\b': 'trailer',
-        r'\btri\b': 'triangle',
-        r'\btkwy\b': 'trunkway',
-        r'\bturn\b': 'turn',
-        r'\bupas\b': 'underpass',
-        r'\bup\b': 'upper',
-        r'\bvale\b': 'vale',
-        r'\bvdct\b': 'viaduct',
-        r'\bvlls\b': 'villas',
-        r'\bvsta\b': 'vista',
-        r'\bwalk\b': 'walk',
-        r'\bwkyw\b': 'walkway',
-        r'\bw\b': 'west',
-        r'\bwhrf\b': 'wharf',
-        r'\bwynd\b': 'wynd',
-        r'\byard\b': 'yard',
-        r'\brch\b': 'reach',
-        r'\bres\b': 'reserve',
-        r'\brtt\b': 'retreat',
-        r'\brgwy\b': 'ridgeway',
-        r'\browy\b': 'right of Way',
-        r'\brvr\b': 'river',
-        r'\brvwy\b': 'riverway',
-        r'\brvra\b': 'riviera',
-        r'\brds\b': 'roads',
-        r'\brdwy\b': 'roadway',
-        r'\brnde\b': 'ronde',
-        r'\brsbl\b': 'rosebowl',
-        r'\brty\b': 'rotary',
-        r'\brnd\b': 'round',
-        r'\brte\b': 'route',
-        r'\brun\b': 'run',
-        r'\bswy\b': 'service way',
-        r'\bsdng\b': 'siding',
-        r'\bslpe\b': 'slope',
-        r'\bsnd\b': 'sound'
-
-    }
-
-    # Use regex to perform replacements only where the whole word matches
-    for old, new in replacements.items():
-        address = re.sub(old, new, address, flags=re.IGNORECASE)
-
-    return address
-
-
-def combined_matching(target_address, target_name, lookout_dataset):
-    best_address = 'none'
-    best_name_match_for_best_address = 'none'
-    best_mobile_number_for_best_address = 'none'  # Add mobile number
-    highest_address_score = 0
-    highest_name_score_for_best_address = 0  # Score for the name corresponding to the best address match
-
-    # First, find the best address match
-    for _, row in lookout_dataset.itertuples():
-        address_score = fuzz.ratio(target_address, row['Address']) / 100
-
-        if address_score > highest_address_score:
-            highest_address_score = address_score
-            best_address = row['Address']
-            best_name_match_for_best_address = row['Full Name']
-            highest_name_score_for_best_address = fuzz.ratio(target_name, row['Last Name']) / 100
-            best_mobile_number_for_best_address = row['Mobile']  # Capture the mobile number
-
-            if address_score*highest_name_score_for_best_address > 0.7:
-                break
-
-    combined_score = highest_address_score * highest_name_score_for_best_address
-
-    return best_address, highest_address_score, best_name_match_for_best_address, highest_name_score_for_best_address, combined_score, best_mobile_number_for_best_address
-
-def confidence(combined_score):
-    if combined_score >= 0.70:
-        return 'High'
-    elif combined_score >= 0.40:
-        return 'Medium'
-    else:
-        return 'Low'
-
-
-def normalize_combined_score(combined_score):
-    return (combined_score - combined_score.min()) / (combined_score.max() - combined_score.min())
-
-
-# Function to save DataFrame to an Excel file in-memory and return it
-def create_styled_excel(df, confidence_col_index):
-    # Create a BytesIO buffer to write the Excel file to
-    output = BytesIO()
-    # Write the DataFrame to an Excel writer
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Sheet1')
-        workbook = writer.book
-        worksheet = writer.sheets['Sheet1']
-
-        # Apply styles after writing
-        for row in range(2, worksheet.max_row + 1):  # Start from 2 to skip the header
-            cell = worksheet.cell(row=row, column=confidence_col_index)
-            value = cell.value
-            color = 'FFFFFF'  # Default white
-            if value == 'High':
-                color = '90EE90'  # Light green
-            elif value == 'Medium':
-                color = 'FFD700'  # Gold
-            elif value == 'Low':
-                color = 'FF6347'  # Tomato red
-            cell.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
-
-    # Rewind the buffer
-    output.seek(0)
-    return output
-
-
-
-# Precompute the scoring matrix for the lookout_dataset
-def precompute_scores(target_address, target_name, lookout_dataset):
-    # Assuming lookout_dataset is a DataFrame with 'Address' and 'Full Name'
-    # Convert the address and name columns to lists for processing.
-    addresses = lookout_dataset['Address'].tolist()
-    names = lookout_dataset['Full Name'].tolist()
-
-    # Precompute the scores as dictionaries if the list of unique values is smaller than the dataset
-    address_scores = {address: fuzz.ratio(target_address, address) for address in set(addresses)}
-    name_scores = {name: fuzz.ratio(target_name, name) for name in set(names)}
-
-    return address_scores, name_scores
-
-
-# Optimized combined_matching function
-def optimized_combined_matching(target_address, target_name, address_scores, name_scores, lookout_dataset):
-    best_address = max(address_scores, key=address_scores.get)
-    highest_address_score = address_scores[best_address]
-
-    # Extract best name match for the best address
-    corresponding_name = lookout_dataset[lookout_dataset['Address'] == best_address]['Full Name'].iloc[0]
-    highest_name_score = name_scores[corresponding_name]
-
-    # Get mobile number for the best address match
-    best_mobile_number_for_best_address = lookout_dataset[lookout_dataset['Address'] == best_address]['Mobile'].iloc[0]
-
-    combined_score = highest_address_score * highest_name_score
-
-    return best_address, highest_address_score, corresponding_name, highest_name_score, combined_score, best_mobile_number_for_best_address
-
-
-
-
-# Assuming dataset1 is your lookup dataset and dataset2 is your target dataset.
-
-def find_best_matches(target_dataset, lookup_dataset):
-    results = []
-
-    # Preparing the lookup lists from the lookup dataset
-    lookup_addresses = lookup_dataset['Address'].tolist()
-    lookup_names = lookup_dataset['Full Name'].tolist()  # Ensure this is correct based on your dataset structure
-
-    for index, row in target_dataset.iterrows():
-        target_address = row['Address']
-        target_name = row["Owner's Name"]
-
-        # Find the best match for the address in lookup_dataset
-        best_address_match = process.extractOne(target_address, lookup_addresses, scorer=fuzz.ratio)
-
-        if best_address_match:
-            # Retrieve the best address match details
-            best_address_score = best_address_match[1]
-            best_address_index = best_address_match[2]
-            best_matched_address = lookup_dataset.iloc[best_address_index]
-
-            # Now match the owner's name only within the context of the matched address
-            # Assuming the best name should be matched within the same record as the best address
-            best_name_score = fuzz.ratio(target_name, best_matched_address['Last Name'])
-
-            results.append({
-                'Best Match Address': best_matched_address['Address'],
-                'Combined Score': float(best_address_score) * float(best_name_score)/10000,
-                'Best Match Name': best_matched_address['Full Name'],
-                'Mobile': best_matched_address['Mobile'],
-            })
-        else:
-            # Append none or default values if no address match is found
-            results.append({
-                'Best Match Address': 'none',
-                'Combined Score': 0,
-                'Best Match Name': 'none',
-                'Mobile': 'none',
-            })
-
-    return pd.DataFrame(results)
-
-# Ensure that dataset1 and dataset2 are defined and structured correctly before calling this function
-
-# Example usage:
-#matches_df = find_best_matches(dataset2, dataset1)
-
-# Now 'matches_df' contains the best matches from the lookup dataset for each entry in the target dataset.
-
-
-def standardize_mobile_v2(mobile):
-    if pd.notna(mobile):
-        mobile_str = str(mobile)
-        return ''.join(filter(str.isdigit, mobile_str))
-    return None
+import pandas as pd
+from rapidfuzz import fuzz,process
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import PatternFill
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.utils import get_column_letter
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.optimize import linear_sum_assignment
+import re
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
+import threading
+import time
+import cProfile
+import pstats
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from io import BytesIO, StringIO
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+try:
+    import resource
+except ImportError:  # Finished worker processes are only measured where the resource module exists (not on Windows)
+    resource = None
+
+try:
+    import jellyfish
+except ImportError:  # Metaphone keys are optional, names fall back to the built-in Soundex keys
+    jellyfish = None
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # The sampling profiler is optional, cProfile is always available
+    SamplingProfiler = None
+
+
+
+# Function to clean column names by removing leading and trailing spaces
+def clean_column_names(df):
+    df.columns = df.columns.str.strip()
+    return df
+
+
+# Common street suffix and postal delivery type abbreviations, matched as whole words
+# (case-insensitive) and replaced by their full form
+ADDRESS_ABBREVIATIONS = {
+    'St': 'street',
+    'Rd': 'road',
+    'Ave': 'avenue',
+    'Pl': 'place',
+    'Dr': 'drive',
+    'Ln': 'lane',
+    'Blvd': 'boulevard',
+    'Ct': 'court',
+    'Ally': 'alley',
+    'Alwy': 'alleyway',
+    'Arc': 'arcade',
+    'Basn': 'basin',
+    'Bch': 'beach',
+    'Bend': 'bend',
+    'Blk': 'block',
+    'Bvd': 'boulevard',
+    'Bdge': 'bridge',
+    'Bdwy': 'broadway',
+    'Bypa': 'bypass',
+    'Bywy': 'byway',
+    'Caus': 'causeway',
+    'Cn': 'central',
+    'Ctr': 'centre',
+    'Cnwy': 'centreway',
+    'Ch': 'chase',
+    'Cir': 'circle',
+    'Cct': 'circuit',
+    'Cl': 'close',
+    'Con': 'concourse',
+    'Cnr': 'corner',
+    # Postal delivery type abbreviations
+    'care po': 'care Of Post Office',
+    'cma': 'community Mail Agent',
+    'cmb': 'community Mail Bag',
+    'gpo box': 'general Post Office Box',
+    'locked bag': 'locked Mail Bag Service',
+    'ms': 'mail Service',
+    'po box': 'post Office Box',
+    'private bag': 'private mail bag service',
+    'rsd': 'roadside delivery',
+    'rmb': 'roadside mail bag',
+    'rms': 'roadside mail service',
+    'cpa': 'community postal agent',
+    'strp': 'strip',
+    'sbwy': 'subway',
+    'thor': 'thoroughfare',
+    'tlwy': 'tollway',
+    'twrs': 'towers',
+    'trk': 'track',
+    'trlr': 'trailer',
+    'tri': 'triangle',
+    'tkwy': 'trunkway',
+    'turn': 'turn',
+    'upas': 'underpass',
+    'up': 'upper',
+    'vale': 'vale',
+    'vdct': 'viaduct',
+    'vlls': 'villas',
+    'vsta': 'vista',
+    'walk': 'walk',
+    'wkyw': 'walkway',
+    'w': 'west',
+    'whrf': 'wharf',
+    'wynd': 'wynd',
+    'yard': 'yard',
+    'rch': 'reach',
+    'res': 'reserve',
+    'rtt': 'retreat',
+    'rgwy': 'ridgeway',
+    'rowy': 'right of Way',
+    'rvr': 'river',
+    'rvwy': 'riverway',
+    'rvra': 'riviera',
+    'rds': 'roads',
+    'rdwy': 'roadway',
+    'rnde': 'ronde',
+    'rsbl': 'rosebowl',
+    'rty': 'rotary',
+    'rnd': 'round',
+    'rte': 'route',
+    'run': 'run',
+    'swy': 'service way',
+    'sdng': 'siding',
+    'slpe': 'slope',
+    'snd': 'sound'
+}
+
+
+# Standardizes addresses by expanding ADDRESS_ABBREVIATIONS.
+# The abbreviation table is compiled once into a single alternation, so every address is
+# rewritten in one regex pass, and results are memoized because the same addresses repeat a lot.
+class AddressStandardizer:
+    def __init__(self, abbreviations=ADDRESS_ABBREVIATIONS, cache_size=2 ** 18):
+        self.replacements = {abbreviation.lower(): full for abbreviation, full in abbreviations.items()}
+        self.pattern = re.compile(
+            r'\b(?:' + '|'.join(re.escape(abbreviation) for abbreviation in abbreviations) + r')\b',
+            flags=re.IGNORECASE,
+        )
+        self._standardize_cached = lru_cache(maxsize=cache_size)(self._standardize)
+
+    def _replace(self, match):
+        return self.replacements[match.group(0).lower()]
+
+    def _standardize(self, address):
+        return self.pattern.sub(self._replace, address)
+
+    def standardize(self, address):
+        return self._standardize_cached(address)
+
+    __call__ = standardize
+
+    # Standardize a whole column: each distinct address is rewritten once, nulls are left as they are
+    def standardize_series(self, addresses):
+        distinct = addresses.dropna().unique()
+        return addresses.map(dict(zip(distinct, map(self.standardize, distinct))))
+
+
+address_standardizer = AddressStandardizer()
+
+
+# Function to standardize common street suffix abbreviations
+def standardize_address(address):
+    return address_standardizer.standardize(address)
+
+
+# Function to normalize the internal (lookup) dataset for matching: lowercase addresses without
+# commas, standardized abbreviations and a lowercase 'Full Name' built from first and last name.
+# standardize=False skips the abbreviation expansion (to time or run it separately).
+def prepare_lookup_dataset(dataset, standardize=True):
+    dataset = clean_column_names(dataset)
+    dataset['Address'] = dataset['Address'].str.lower().str.replace(',', '').str.strip()
+    dataset['Full Name'] = (dataset['First Name'].map(str) + ' ' + dataset['Last Name'].map(str)).str.strip().str.lower()
+    if standardize:
+        dataset['Address'] = address_standardizer.standardize_series(dataset['Address'])
+    return dataset
+
+
+# Function to intern the text columns of a (prepared) lookup dataset: each becomes a categorical
+# column, that is one small integer code per row plus every distinct value stored once (in order of
+# first appearance, so the first row of a value is also the first row among its duplicates).
+# Matchers score the distinct values and only turn codes back into strings for the results.
+# With pandas 3 and pyarrow the distinct strings live in Arrow string buffers.
+def intern_lookup_dataset(lookup_dataset):
+    for column in lookup_dataset.columns:
+        values = lookup_dataset[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.infer_dtype(values, skipna=True) == 'string':
+            codes, uniques = pd.factorize(values)
+            lookup_dataset[column] = categorical_column(codes, uniques).set_axis(lookup_dataset.index)
+    return lookup_dataset
+
+
+# Function to build a categorical column from codes (-1 where missing) and the distinct values,
+# through an Arrow dictionary array when pyarrow is installed (much faster for millions of values)
+def categorical_column(codes, uniques):
+    codes = np.asarray(codes)
+    if pa is not None:
+        return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), pa.array(uniques)).to_pandas()
+    return pd.Series(pd.Categorical.from_codes(codes, categories=uniques))
+
+
+# Function to store distinct text values as one UTF-8 byte buffer plus the offset where each value
+# starts (the layout of an Arrow large_string array), so they can be memory-mapped back without a copy
+def text_buffers(values):
+    if pa is not None:
+        strings = pa.array(np.asarray(values, dtype=object), type=pa.large_string())
+        _, offsets, data = strings.buffers()
+        offsets = np.frombuffer(offsets, dtype=np.int64)[:len(strings) + 1]
+        data = np.frombuffer(data, dtype=np.uint8) if data is not None else np.empty(0, dtype=np.uint8)
+        return data[:offsets[-1]], offsets
+    encoded = [str(value).encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+# Function to turn the buffers of text_buffers back into an Index of the values. With pyarrow the
+# index is an Arrow string array over the given (memory-mapped) buffers, so nothing is copied.
+def text_values(data, offsets):
+    if pa is not None:
+        strings = pa.LargeStringArray.from_buffers(len(offsets) - 1, pa.py_buffer(offsets), pa.py_buffer(data))
+        return pd.Index(pd.array(strings, dtype='str'))
+    data = bytes(data)
+    return pd.Index([data[start:stop].decode() for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist())],
+                    dtype=object)
+
+
+# Function to build a categorical column from codes and categories known to be distinct (as stored
+# from pd.factorize). Pandas' own check hashes every category, which for millions of addresses takes
+# far more memory than the column, so it is skipped; the codes array is used as it is.
+def distinct_categorical_column(codes, categories):
+    dtype = pd.CategoricalDtype._from_fastpath(categories, ordered=False)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype, validate=False))
+
+
+# Function to normalize the target dataset the same way; 'Suburb' is merged into 'Address'
+# for full address comparison.
+# The text columns are cast to object first: a CSV chunk whose values in a column are all blank
+# is read as float64, which has no .str accessor.
+def prepare_target_dataset(dataset, standardize=True):
+    dataset = clean_column_names(dataset)
+    for column in ('Address', 'Suburb', "Owner's Name"):
+        dataset[column] = dataset[column].astype(object)
+    dataset['Address'] = dataset['Address'].str.lower().str.cat(dataset['Suburb'], sep=', ')
+    dataset['Address'] = dataset['Address'].str.lower().str.replace(',', '').str.strip()
+    dataset["Owner's Name"] = dataset["Owner's Name"].str.lower().str.strip()
+    if standardize:
+        dataset['Address'] = address_standardizer.standardize_series(dataset['Address'])
+    return dataset
+
+
+# Function to read an uploaded (or local) Excel/CSV file into a DataFrame, by file extension
+def read_dataset(file, **kwargs):
+    name = getattr(file, 'name', str(file))
+    if name.endswith('.xlsx'):
+        return pd.read_excel(file, **kwargs)
+    if name.endswith('.csv'):
+        return pd.read_csv(file, **kwargs)
+    raise ValueError("Invalid file format. Please upload an Excel file.")
+
+
+def confidence(combined_score):
+    if combined_score >= 0.70:
+        return 'High'
+    elif combined_score >= 0.40:
+        return 'Medium'
+    else:
+        return 'Low'
+
+
+def normalize_combined_score(combined_score):
+    return (combined_score - combined_score.min()) / (combined_score.max() - combined_score.min())
+
+
+# Function to flag the matches that lose their address to a better scoring target:
+# within each best match address only the highest combined score keeps it.
+# Returns a boolean mask in the original order.
+def duplicate_matches(combined_score, best_match_address):
+    ranked = pd.DataFrame({'score': np.asarray(combined_score), 'address': np.asarray(best_match_address, dtype=object)})
+    ranked = ranked.sort_values(by='score', ascending=False, kind='stable')
+    return ranked.duplicated(subset=['address'], keep='first').sort_index().to_numpy()
+
+
+# Function to blank the matches flagged by duplicate_matches: they lose their address, name and
+# mobile and are marked 'No Match'
+def suppress_duplicate_matches(dataset, is_duplicate):
+    dataset.loc[is_duplicate, ['Best Match Address', 'Mobile', 'Best Match Name']] = np.nan
+    dataset.loc[is_duplicate, ['Combined Score']] = 0
+    dataset.loc[is_duplicate, ['Confidence']] = 'No Match'
+    return dataset
+
+
+# Small bonus every assigned candidate gets on top of its combined score, so the assignment also
+# prefers more matches when the combined scores are 0 (no name matched)
+ASSIGNMENT_MATCH_BONUS = 1e-6
+# Largest group of competing targets x addresses that is solved exactly; larger groups are assigned
+# greedily (best remaining score first)
+ASSIGNMENT_MAX_CELLS = 4 * 1024 ** 2
+
+
+# Function to get the (address, name, mobile, score) columns of every candidate in the matches:
+# the best match, followed by the alternatives of the top_k strategy
+def match_candidate_columns(matches_df):
+    candidates = [('Best Match Address', 'Best Match Name', 'Mobile', 'Combined Score')]
+    rank = 1
+    while f'Alternative {rank} Address' in matches_df.columns:
+        candidates.append(tuple(f'Alternative {rank} {field}' for field in ('Address', 'Name', 'Mobile', 'Score')))
+        rank += 1
+    return candidates
+
+
+# Function to pick the edges of a maximum weight one-to-one assignment of a group of targets
+# (rows) to addresses (columns) with the Hungarian algorithm. Returns a mask of the chosen edges.
+def _assign_exactly(rows, columns, weights):
+    rows = np.unique(rows, return_inverse=True)[1]
+    columns = np.unique(columns, return_inverse=True)[1]
+    edge_ids = np.full((rows.max() + 1, columns.max() + 1), -1, dtype=np.int64)
+    edge_ids[rows, columns] = np.arange(len(rows))
+    matrix = np.zeros(edge_ids.shape)
+    matrix[rows, columns] = weights
+    assigned_rows, assigned_columns = linear_sum_assignment(matrix, maximize=True)
+    # Pairs without an edge between them weigh 0 and just mean 'no match'
+    chosen = edge_ids[assigned_rows, assigned_columns]
+    mask = np.zeros(len(rows), dtype=bool)
+    mask[chosen[chosen >= 0]] = True
+    return mask
+
+
+# Function to pick the edges of a one-to-one assignment greedily: in every round each target
+# proposes its best remaining edge, each address accepts its best proposal, and the targets and
+# addresses taken drop out. Returns a mask of the chosen edges.
+def _assign_greedily(rows, columns, weights):
+    mask = np.zeros(len(rows), dtype=bool)
+    alive = np.ones(len(rows), dtype=bool)
+    while alive.any():
+        edges = np.flatnonzero(alive)
+        edges = edges[np.lexsort((-weights[edges], rows[edges]))]
+        edges = edges[np.unique(rows[edges], return_index=True)[1]]
+        edges = edges[np.lexsort((-weights[edges], columns[edges]))]
+        edges = edges[np.unique(columns[edges], return_index=True)[1]]
+        mask[edges] = True
+        alive &= ~np.isin(rows, rows[edges]) & ~np.isin(columns, columns[edges])
+    return mask
+
+
+# Function to give every matched address to at most one target as a one-to-one assignment that
+# maximizes the total combined score over all candidates (the best match and the alternatives).
+# Targets and addresses are split into groups that compete with each other (the connected
+# components of the candidate graph); a target alone in its group keeps its best candidate, the
+# other groups are solved one by one.
+# Returns the matches with the assigned candidate as the best match, where an assigned alternative
+# swaps places with the best match so no candidate is listed twice, and a mask of the targets left
+# without an address.
+def assign_matches(matches_df):
+    candidates = match_candidate_columns(matches_df)
+    addresses = np.column_stack([matches_df[columns[0]].to_numpy(dtype=object) for columns in candidates])
+    scores = np.column_stack([matches_df[columns[3]].to_numpy(dtype=np.float64) for columns in candidates])
+    present = pd.notna(addresses) & (addresses != 'none')
+
+    # One edge per target and address, from the candidate with the best score (the first on ties)
+    rows, ranks = np.nonzero(present)
+    codes, _ = pd.factorize(addresses[rows, ranks])
+    order = np.lexsort((ranks, -scores[rows, ranks], codes, rows))
+    rows, ranks, codes = rows[order], ranks[order], codes[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (codes[1:] != codes[:-1])
+    rows, ranks, codes = rows[first], ranks[first], codes[first]
+    weights = scores[rows, ranks] + ASSIGNMENT_MATCH_BONUS
+
+    # Targets are nodes 0..n-1 and addresses n.., so each component is a group of competitors
+    n = len(matches_df)
+    n_nodes = n + (codes.max() + 1 if len(codes) else 0)
+    graph = sparse.csr_matrix((np.ones(len(rows)), (rows, n + codes)), shape=(n_nodes, n_nodes))
+    labels = connected_components(graph, directed=False)[1][rows]
+    group_rows = np.bincount(labels[np.unique(rows, return_index=True)[1]], minlength=labels.max() + 1 if len(labels) else 0)
+
+    chosen = np.zeros(len(rows), dtype=bool)
+    alone = group_rows[labels] == 1
+    # A target alone in its group takes its best scoring candidate
+    best = np.flatnonzero(alone)[np.lexsort((ranks[alone], -weights[alone], rows[alone]))]
+    chosen[best[np.unique(rows[best], return_index=True)[1]]] = True
+
+    grouped = np.flatnonzero(~alone)
+    grouped = grouped[np.argsort(labels[grouped], kind='stable')]
+    bounds = np.flatnonzero(np.diff(labels[grouped])) + 1
+    for edges in np.split(grouped, bounds) if len(grouped) else []:
+        cells = len(np.unique(rows[edges])) * len(np.unique(codes[edges]))
+        assign = _assign_exactly if cells <= ASSIGNMENT_MAX_CELLS else _assign_greedily
+        chosen[edges] = assign(rows[edges], codes[edges], weights[edges])
+
+    assigned_rank = np.full(n, -1, dtype=np.int64)
+    assigned_rank[rows[chosen]] = ranks[chosen]
+    assigned = matches_df.copy()
+    moved = np.flatnonzero(assigned_rank > 0)
+    for field in range(len(candidates[0])):
+        values = np.column_stack([matches_df[columns[field]].to_numpy(dtype=object) for columns in candidates])
+        values[moved, 0], values[moved, assigned_rank[moved]] = values[moved, assigned_rank[moved]], values[moved, 0]
+        for rank in [0, *np.unique(assigned_rank[moved]).tolist()]:
+            assigned[candidates[rank][field]] = values[:, rank].tolist()
+    return assigned, present.any(axis=1) & (assigned_rank < 0)
+
+
+# Function to add the matches to the target dataset, normalize and grade the combined score,
+# sort by it and keep each matched address only for its best scoring target.
+# With one_to_one the addresses are instead handed out by assign_matches, so a target that loses
+# its best address can still get one of its alternatives; how many more targets that matches than
+# keeping only the best scoring target is reported in the results' attrs['assignment'].
+def finalize_matches(target_dataset, matches_df, one_to_one=False):
+    if one_to_one:
+        start = time.perf_counter()
+        best_addresses = matches_df['Best Match Address']
+        sort_and_blank = best_addresses[best_addresses.notna() & (best_addresses != 'none')].nunique()
+        matches_df, unassigned = assign_matches(matches_df)
+        assigned = int((matches_df['Best Match Address'] != 'none').sum() - unassigned.sum())
+        assignment = {
+            'matched (sort and blank)': int(sort_and_blank), 'matched (assignment)': assigned,
+            'recovered': assigned - int(sort_and_blank), 'seconds': time.perf_counter() - start,
+        }
+
+    # The match's 'Mobile' replaces any 'Mobile' column of the target dataset
+    match_columns = ['Best Match Address', 'Best Match Name', 'Combined Score', 'Mobile']
+    target_dataset[match_columns] = matches_df[match_columns].set_axis(target_dataset.index)
+
+    target_dataset['Combined Score'] = normalize_combined_score(target_dataset['Combined Score'])
+    target_dataset['Confidence'] = target_dataset['Combined Score'].apply(confidence)
+    # Any further columns of the matches (such as the top_k strategy's alternatives) follow
+    extra_columns = [column for column in matches_df.columns if column not in match_columns]
+    target_dataset[extra_columns] = matches_df[extra_columns].set_axis(target_dataset.index)
+
+    # Sort the DataFrame by 'Combined Score' in descending order
+    df_sorted = target_dataset.sort_values(by='Combined Score', ascending=False)
+    if one_to_one:
+        is_duplicate = pd.Series(unassigned, index=target_dataset.index)[df_sorted.index].to_numpy()
+    else:
+        is_duplicate = duplicate_matches(df_sorted['Combined Score'], df_sorted['Best Match Address'])
+    df_sorted = suppress_duplicate_matches(df_sorted, is_duplicate)
+    if one_to_one:
+        df_sorted.attrs['assignment'] = assignment
+    return df_sorted
+
+
+# Fill colour of each confidence level in the exported Excel files
+CONFIDENCE_COLORS = {
+    'High': '90EE90',  # Light green
+    'Medium': 'FFD700',  # Gold
+    'Low': 'FF6347',  # Tomato red
+}
+
+
+# Function to add the confidence colouring to a worksheet as conditional formatting rules on the
+# confidence column (rows 2 to last_row), so no per-cell style objects are needed
+def add_confidence_formatting(worksheet, confidence_col_index, last_row):
+    column = get_column_letter(confidence_col_index)
+    cells = f'{column}2:{column}{max(last_row, 2)}'
+    for value, color in CONFIDENCE_COLORS.items():
+        fill = PatternFill(start_color=color, end_color=color, fill_type='solid')
+        worksheet.conditional_formatting.add(cells, CellIsRule(operator='equal', formula=[f'"{value}"'], fill=fill))
+
+
+# Function to save DataFrame to an Excel file in-memory and return it
+def create_styled_excel(df, confidence_col_index):
+    # Create a BytesIO buffer to write the Excel file to
+    output = BytesIO()
+    # Stream the rows through a write-only workbook, coloured by conditional formatting
+    export_results(df, output, 'xlsx', confidence_column=df.columns[confidence_col_index - 1])
+
+    # Rewind the buffer
+    output.seek(0)
+    return output
+
+
+# Function to export a results DataFrame as 'xlsx' (styled), 'csv' or 'parquet' to a path or buffer.
+# CSV and Parquet are much faster to write than Excel for very large results.
+def export_results(df, output, output_format='xlsx', confidence_column='Confidence'):
+    # Excel rows are converted and appended a chunk at a time, the other writers take the whole frame
+    step = STREAM_CHUNK_SIZE if output_format == 'xlsx' else max(len(df), 1)
+    with ResultWriter(output, output_format, confidence_column=confidence_column) as writer:
+        for start in range(0, max(len(df), 1), step):
+            writer.write(df.iloc[start:start + step])
+    return output
+
+
+# Upper bound on the size of one block of the address score matrix (float32 scores).
+# The number of target rows scored per block is derived from this when chunk_size is not given.
+MATCH_BLOCK_BYTES = 256 * 1024 ** 2
+
+
+# Counts the fuzzy comparisons (scored string pairs) made in this process, for the run statistics
+class ComparisonCounter:
+    def __init__(self):
+        self.count = 0
+
+
+fuzzy_comparisons = ComparisonCounter()
+
+
+# Function to score every query against every choice (process.cdist), counting the comparisons
+def score_matrix(queries, choices, **kwargs):
+    fuzzy_comparisons.count += len(queries) * len(choices)
+    return process.cdist(queries, choices, **kwargs)
+
+
+# Function to score the queries against the choices pair by pair (process.cpdist), counting the comparisons
+def score_pairs(queries, choices, **kwargs):
+    fuzzy_comparisons.count += len(queries)
+    return process.cpdist(queries, choices, **kwargs)
+
+
+# Function to turn a column into a list of strings plus a mask of the usable (non-null) entries.
+# An interned (categorical) column only converts the distinct values its rows hold.
+def _string_values(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy()
+        return _code_strings(column.cat.categories, codes).tolist(), codes >= 0
+    valid = column.notna().to_numpy()
+    values = column.where(column.notna(), '').astype(str).tolist()
+    return values, valid
+
+
+# Function to get the codes (-1 for nulls) and the distinct values of a lookup column without turning
+# it into strings: an interned (categorical) column as it is, any other column through pd.factorize
+def _column_codes(column):
+    column = pd.Series(column)
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64), column.cat.categories
+    codes, uniques = pd.factorize(column)
+    return codes.astype(np.int64), pd.Index(uniques)
+
+
+# Function to turn codes from _column_codes into strings ('' for -1), converting each distinct value
+# they refer to once instead of the whole column
+def _code_strings(categories, codes):
+    distinct, inverse = np.unique(codes, return_inverse=True)
+    strings = np.full(len(distinct), '', dtype=object)
+    valid = distinct >= 0
+    strings[valid] = categories.take(distinct[valid]).astype(str).tolist()
+    return strings[inverse.reshape(np.shape(codes))]
+
+
+# Function to get the distinct non-null values of a lookup column as the strings to score, in the
+# order of their first rows so ties still go to the first row, those rows to map the winners back,
+# and the codes of every row (from _column_codes)
+def _distinct_choices(lookup_addresses):
+    codes, categories = _column_codes(lookup_addresses)
+    distinct, choice_rows = np.unique(codes, return_index=True)
+    distinct, choice_rows = distinct[distinct >= 0], choice_rows[distinct >= 0]
+    order = np.argsort(choice_rows)
+    return categories.take(distinct[order]).astype(str).tolist(), choice_rows[order], codes
+
+
+# Function to pick how many target rows are scored against the lookup list in one block
+def _match_chunk_size(n_lookup, chunk_size=None):
+    if chunk_size:
+        return max(1, int(chunk_size))
+    return max(1, MATCH_BLOCK_BYTES // (4 * max(n_lookup, 1)))
+
+
+# Function to find the best scoring lookup address for every target address.
+# Targets are scored in blocks against the whole lookup list as a NumPy score matrix,
+# so memory stays bounded by the block size. Returns the index of the best lookup row
+# (-1 where there is no match) and its exact fuzz.ratio score.
+def best_address_matches(target_addresses, lookup_addresses, chunk_size=None, workers=-1, scorer=fuzz.ratio):
+    queries, query_valid = _string_values(pd.Series(target_addresses))
+    # Every distinct lookup address is scored once and the winners map back to its first row
+    choices, choice_rows, _ = _distinct_choices(lookup_addresses)
+
+    best_index = np.full(len(queries), -1, dtype=np.int64)
+    best_score = np.zeros(len(queries), dtype=np.float64)
+    if not len(queries) or not len(choices):
+        return best_index, best_score
+
+    block = _match_chunk_size(len(choices), chunk_size)
+    for start in range(0, len(queries), block):
+        stop = min(start + block, len(queries))
+        scores = score_matrix(queries[start:stop], choices, scorer=scorer, dtype=np.float32, workers=workers)
+        best_index[start:stop] = scores.argmax(axis=1)
+
+    best_index[~query_valid] = -1
+    matched = best_index >= 0
+    # Rescore the winning pairs in double precision so the scores equal fuzz.ratio exactly
+    best_score[matched] = score_pairs(
+        [queries[i] for i in np.flatnonzero(matched)],
+        [choices[i] for i in best_index[matched]],
+        scorer=scorer, dtype=np.float64, workers=workers,
+    )
+    best_index[matched] = choice_rows[best_index[matched]]
+    return best_index, best_score
+
+
+# Function to find the top_k best scoring lookup rows of every target address, scored in the same
+# blocks as best_address_matches. Returns the lookup row positions (best first, ties in lookup
+# order, padded with -1) and their exact scores (0 for padding).
+# Every distinct address is scored once; rows that share an address (the people living there) are
+# still separate candidates, ranked as if every row had been scored.
+def find_top_k_candidates(target_addresses, lookup_addresses, top_k=5, chunk_size=None, workers=-1,
+                          scorer=fuzz.ratio):
+    queries, query_valid = _string_values(pd.Series(target_addresses))
+    choices, choice_rows, lookup_codes = _distinct_choices(lookup_addresses)
+    top_k = max(1, min(int(top_k), len(lookup_codes)))
+
+    candidates = np.full((len(queries), top_k), -1, dtype=np.int64)
+    candidate_scores = np.zeros((len(queries), top_k), dtype=np.float64)
+    if not len(queries) or not len(choices):
+        return candidates, candidate_scores
+
+    # The top_k rows always belong to the top_k distinct addresses (by score, then first row)
+    top_choices = min(top_k, len(choices))
+    choice_index = np.full((len(queries), top_choices), -1, dtype=np.int64)
+    block = _match_chunk_size(len(choices), chunk_size)
+    for start in range(0, len(queries), block):
+        stop = min(start + block, len(queries))
+        scores = score_matrix(queries[start:stop], choices, scorer=scorer, dtype=np.float32, workers=workers)
+        # Partition out the k-th best score of every row, then rank only the columns reaching it by
+        # score and first lookup row, so ties go to the first rows like in best_address_matches
+        threshold = np.partition(scores, -top_choices, axis=1)[:, -top_choices]
+        rows, columns = np.nonzero(scores >= threshold[:, None])
+        order = np.lexsort((columns, -scores[rows, columns], rows))
+        rows, columns = rows[order], columns[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        keep = rank < top_choices
+        choice_index[start + rows[keep], rank[keep]] = columns[keep]
+
+    choice_index[~query_valid] = -1
+    present = choice_index >= 0
+    pair_queries = np.repeat(np.arange(len(queries)), present.sum(axis=1))
+    pair_choices = choice_index[present]
+    # Rescore the candidate addresses in double precision so the scores equal the scorer exactly
+    pair_scores = score_pairs(
+        np.asarray(queries, dtype=object)[pair_queries].tolist(),
+        np.asarray(choices, dtype=object)[pair_choices].tolist(),
+        scorer=scorer, dtype=np.float64, workers=workers,
+    )
+
+    # Expand every candidate address into its first top_k rows in lookup order
+    pair_codes = lookup_codes[choice_rows[pair_choices]]
+    row_counts = np.bincount(lookup_codes[lookup_codes >= 0], minlength=len(choices))
+    lengths = np.minimum(row_counts[pair_codes], top_k)
+    pair_of = np.repeat(np.arange(len(pair_choices)), lengths)
+    pair_rows = choice_rows[pair_choices][pair_of]
+    shared = lengths[pair_of] > 1
+    if shared.any():
+        shared_rows = np.flatnonzero(np.isin(lookup_codes, np.unique(pair_codes[lengths > 1])))
+        shared_rows = shared_rows[np.argsort(lookup_codes[shared_rows], kind='stable')]
+        group_starts = np.searchsorted(lookup_codes[shared_rows], pair_codes)
+        within = np.arange(len(pair_of)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pair_rows[shared] = shared_rows[group_starts[pair_of[shared]] + within[shared]]
+
+    # Rank the rows by score (at the precision they were selected with) and lookup position
+    row_queries, row_scores = pair_queries[pair_of], pair_scores[pair_of]
+    order = np.lexsort((pair_rows, -row_scores.astype(np.float32), row_queries))
+    row_queries, row_scores, pair_rows = row_queries[order], row_scores[order], pair_rows[order]
+    rank = np.arange(len(order)) - np.searchsorted(row_queries, row_queries)
+    keep = rank < top_k
+    candidates[row_queries[keep], rank[keep]] = pair_rows[keep]
+    candidate_scores[row_queries[keep], rank[keep]] = row_scores[keep]
+    return candidates, candidate_scores
+
+
+# Function to score the target names against the names of their matched lookup rows, pair by pair.
+# Pairs with a missing name (or no matched row) score 0, like fuzz.ratio does for None.
+# With a name_matcher (a NameMatcher) the names are scored by it instead of with scorer.
+def pairwise_name_scores(target_names, lookup_names, best_index, workers=-1, scorer=fuzz.ratio, name_matcher=None):
+    if name_matcher is not None:
+        return name_matcher.score_pairs(target_names, lookup_names, best_index, workers=workers)
+    names, names_valid = _string_values(pd.Series(target_names))
+
+    name_scores = np.zeros(len(names), dtype=np.float64)
+    rows = np.flatnonzero(best_index >= 0)
+    # Only the matched lookup rows' names are turned into strings
+    candidates, candidates_valid = _string_values(pd.Series(lookup_names).iloc[best_index[rows]])
+    keep = names_valid[rows] & candidates_valid
+    if keep.any():
+        name_scores[rows[keep]] = score_pairs(
+            [names[i] for i in rows[keep]],
+            [candidate for candidate, valid in zip(candidates, keep) if valid],
+            scorer=scorer, dtype=np.float64, workers=workers,
+        )
+    return name_scores
+
+
+# Soundex digit of every consonant; vowels, h, w and y have none
+SOUNDEX_DIGITS = {
+    letter: digit
+    for letters, digit in [('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6')]
+    for letter in letters
+}
+
+
+# Function to get the Soundex code of a lowercase word: its first letter and up to three digits
+# for the following consonants, where equal digits next to each other (or only split by h or w)
+# count once
+def soundex(word):
+    if not word:
+        return ''
+    code, previous = word[0].upper(), SOUNDEX_DIGITS.get(word[0], '')
+    for letter in word[1:]:
+        digit = SOUNDEX_DIGITS.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+# Function to get the phonetic key of a lowercase word: Metaphone when jellyfish is installed,
+# otherwise Soundex
+def phonetic_key(word):
+    if jellyfish is not None:
+        return jellyfish.metaphone(word)
+    return soundex(word)
+
+
+# Function to normalize a name for the token based scorers: lowercase words without punctuation,
+# in sorted order ("O'Brien,  Mary" -> "mary obrien")
+def normalize_name(name):
+    return ' '.join(sorted(re.findall(r'[a-z0-9]+', name.lower().replace("'", ''))))
+
+
+# Scorers for the owner's name that can be selected in find_best_matches (name_scorer). 'ratio'
+# compares the names as they are, which is how the names have always been scored. The others
+# compare the normalized names, whose words are already sorted, so 'token_sort' is a plain ratio
+# on them. 'phonetic' is 'token_sort', raised to PHONETIC_MATCH_SCORE when the names sound alike.
+NAME_SCORERS = {
+    'ratio': fuzz.ratio,
+    'token_sort': fuzz.ratio,
+    'token_set': fuzz.token_set_ratio,
+    'partial': fuzz.partial_ratio,
+    'phonetic': fuzz.ratio,
+}
+# Lowest name score of two names that sound alike with the 'phonetic' scorer: every word of the
+# lookup name has the phonetic key of a word of the owner's name ('smyth' and 'j smith')
+PHONETIC_MATCH_SCORE = 90
+# Number of (owner's name, lookup name) scores a NameMatcher remembers
+NAME_SCORE_CACHE_SIZE = 2 ** 20
+
+
+# Scores owner's names against lookup names with one of the NAME_SCORERS. Every distinct name is
+# normalized and given its phonetic keys once, every distinct pair of names in a call is scored
+# once, and the scores of the most recently used pairs are kept in a bounded LRU cache for the
+# next calls, since the same surnames come back across chunks, shards and runs.
+class NameMatcher:
+    def __init__(self, scorer='ratio', cache_size=NAME_SCORE_CACHE_SIZE, names_cache_size=2 ** 18):
+        if scorer not in NAME_SCORERS:
+            raise ValueError(f"Unknown name scorer '{scorer}', expected one of {list(NAME_SCORERS)}")
+        self.scorer = scorer
+        self.cache_size = cache_size
+        self.scores = OrderedDict()
+        self._form_cached = lru_cache(maxsize=names_cache_size)(self._form)
+        self._keys_cached = lru_cache(maxsize=names_cache_size)(self._keys)
+
+    def _form(self, name):
+        return name if self.scorer == 'ratio' else normalize_name(name)
+
+    def _keys(self, form):
+        return frozenset(map(phonetic_key, form.split()))
+
+    # Function to get the form of a name that is scored (the normalized name for the token scorers)
+    def form(self, name):
+        return self._form_cached(name)
+
+    # Function to get the set of phonetic keys of the words of a normalized name
+    def phonetic_keys(self, form):
+        return self._keys_cached(form)
+
+    # Function to score a list of (target form, lookup form) pairs, taking known pairs from the cache
+    def score_forms(self, pairs, workers=-1):
+        scores = np.empty(len(pairs), dtype=np.float64)
+        missing = []
+        for position, pair in enumerate(pairs):
+            score = self.scores.get(pair)
+            if score is None:
+                missing.append(position)
+            else:
+                self.scores.move_to_end(pair)
+                scores[position] = score
+        if missing:
+            queries = [pairs[position][0] for position in missing]
+            choices = [pairs[position][1] for position in missing]
+            computed = score_pairs(queries, choices, scorer=NAME_SCORERS[self.scorer], dtype=np.float64,
+                                   workers=workers)
+            if self.scorer == 'phonetic':
+                sound_alike = np.fromiter(
+                    (bool(choice) and self.phonetic_keys(choice) <= self.phonetic_keys(query)
+                     for query, choice in zip(queries, choices)),
+                    dtype=bool, count=len(missing),
+                )
+                computed = np.where(sound_alike, np.maximum(computed, PHONETIC_MATCH_SCORE), computed)
+            scores[missing] = computed
+            for position, score in zip(missing, computed.tolist()):
+                self.scores[pairs[position]] = score
+            while len(self.scores) > self.cache_size:
+                self.scores.popitem(last=False)
+        return scores
+
+    # Function to score the target names against the names of their matched lookup rows, like
+    # pairwise_name_scores: pairs with a missing name (or no matched row) score 0
+    def score_pairs(self, target_names, lookup_names, best_index, workers=-1):
+        name_scores = np.zeros(len(best_index), dtype=np.float64)
+        rows = np.flatnonzero(best_index >= 0)
+        target_codes, target_uniques = pd.factorize(pd.Series(target_names).iloc[rows])
+        lookup_names = pd.Series(lookup_names)
+        if isinstance(lookup_names.dtype, pd.CategoricalDtype):
+            lookup_codes, lookup_uniques = lookup_names.cat.codes.to_numpy()[best_index[rows]], lookup_names.cat.categories
+        else:
+            lookup_codes, lookup_uniques = pd.factorize(lookup_names.iloc[best_index[rows]])
+        keep = (target_codes >= 0) & (lookup_codes >= 0)
+        if not keep.any():
+            return name_scores
+
+        # Every distinct pair of names is scored once
+        pair_keys, pair_codes = np.unique(
+            target_codes[keep].astype(np.int64) * len(lookup_uniques) + lookup_codes[keep], return_inverse=True
+        )
+        target_forms = [self.form(str(name)) for name in np.asarray(target_uniques, dtype=object)]
+        lookup_uniques = np.asarray(lookup_uniques, dtype=object)
+        lookup_forms = {}
+        pairs = []
+        for target_code, lookup_code in zip((pair_keys // len(lookup_uniques)).tolist(),
+                                            (pair_keys % len(lookup_uniques)).tolist()):
+            if lookup_code not in lookup_forms:
+                lookup_forms[lookup_code] = self.form(str(lookup_uniques[lookup_code]))
+            pairs.append((target_forms[target_code], lookup_forms[lookup_code]))
+        name_scores[rows[keep]] = self.score_forms(pairs, workers=workers)[pair_codes]
+        return name_scores
+
+
+# Function to get the NameMatcher of a name scorer, shared by all matches in this process so its
+# cache carries over between calls. None for 'ratio', which pairwise_name_scores scores directly.
+@lru_cache(maxsize=None)
+def shared_name_matcher(name_scorer='ratio'):
+    if name_scorer not in NAME_SCORERS:
+        raise ValueError(f"Unknown name scorer '{name_scorer}', expected one of {list(NAME_SCORERS)}")
+    return None if name_scorer == 'ratio' else NameMatcher(name_scorer)
+
+
+# Function to build the results DataFrame (the schema dashboard_1 consumes) from the matched lookup rows
+def build_match_results(lookup_dataset, best_index, address_scores, name_scores):
+    matched = best_index >= 0
+
+    columns = {}
+    for column, source in [('Best Match Address', 'Address'), ('Best Match Name', 'Full Name'), ('Mobile', 'Mobile')]:
+        values = np.full(len(best_index), 'none', dtype=object)
+        values[matched] = lookup_dataset[source].iloc[best_index[matched]].to_numpy(dtype=object)
+        columns[column] = values.tolist()
+
+    return pd.DataFrame({
+        'Best Match Address': columns['Best Match Address'],
+        'Combined Score': np.where(matched, address_scores * name_scores / 10000, 0.0),
+        'Best Match Name': columns['Best Match Name'],
+        'Mobile': columns['Mobile'],
+    })
+
+# Function to find the best matches by scoring every target against every lookup address
+def find_best_matches_full(target_dataset, lookup_dataset, chunk_size=None, workers=-1, name_matcher=None):
+    # Score all target addresses against the lookup addresses in blocks and keep the best one per target
+    best_index, address_scores = best_address_matches(
+        target_dataset['Address'], lookup_dataset['Address'], chunk_size=chunk_size, workers=workers
+    )
+
+    # Now match the owner's name only within the context of the matched address
+    # The best name is matched within the same record as the best address
+    name_scores = pairwise_name_scores(
+        target_dataset["Owner's Name"], lookup_dataset['Last Name'], best_index, workers=workers,
+        name_matcher=name_matcher,
+    )
+
+    return build_match_results(lookup_dataset, best_index, address_scores, name_scores)
+
+# Posting lists longer than this are considered too common to be useful blocking keys
+# (e.g. 'street', or a house number shared by thousands of rows) and are left out of the index.
+MAX_BLOCK_SIZE = 2000
+
+
+# Function to get the blocking keys of an address: each word token (street name, street type,
+# suburb) and each pair of adjacent tokens. House numbers only block together with the street
+# name next to them, on their own they select far too many rows.
+def blocking_keys(address):
+    tokens = address.split()
+    keys = {token for token in tokens if not token.isdigit()}
+    keys.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+    return keys
+
+
+# Function to build an inverted index from blocking key to the lookup rows containing it.
+# Built once over the lookup addresses; the posting lists are sorted arrays of row positions.
+def build_blocking_index(lookup_addresses, max_block_size=MAX_BLOCK_SIZE):
+    postings = {}
+    for position, address in enumerate(lookup_addresses):
+        if not isinstance(address, str):
+            continue
+        for key in blocking_keys(address):
+            postings.setdefault(key, []).append(position)
+
+    return {
+        key: np.asarray(rows, dtype=np.int64)
+        for key, rows in postings.items()
+        if len(rows) <= max_block_size
+    }
+
+
+# Function to get the candidate lookup rows for one target address (sorted, may be empty)
+def blocking_candidates(blocking_index, address):
+    blocks = [blocking_index[key] for key in blocking_keys(address) if key in blocking_index]
+    if not blocks:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(blocks))
+
+
+# Function to find the best matches like find_best_matches, but fuzzy-scoring each target only
+# against the lookup rows that share a blocking key with it.
+# fallback='full' scans the whole lookup list for targets without candidates, fallback='none'
+# reports them as no match.
+def find_best_matches_blocked(target_dataset, lookup_dataset, blocking_index=None, fallback='full',
+                              chunk_size=None, workers=-1, name_matcher=None):
+    if fallback not in ('full', 'none'):
+        raise ValueError(f"Unknown fallback '{fallback}', expected 'full' or 'none'")
+    if blocking_index is None:
+        blocking_index = build_blocking_index(lookup_dataset['Address'])
+
+    queries, query_valid = _string_values(target_dataset['Address'])
+    lookup_codes, lookup_categories = _column_codes(lookup_dataset['Address'])
+
+    best_index = np.full(len(queries), -1, dtype=np.int64)
+    address_scores = np.zeros(len(queries), dtype=np.float64)
+    blocked = []
+    unblocked = []
+    for position, query in enumerate(queries):
+        if not query_valid[position]:
+            continue
+        candidates = blocking_candidates(blocking_index, query)
+        candidates = candidates[lookup_codes[candidates] >= 0]
+        if not len(candidates):
+            unblocked.append(position)
+            continue
+        # Each distinct address is a candidate once, at its first row: the candidates are in lookup
+        # order, so ties resolve to the same row as a full scan
+        _, first = np.unique(lookup_codes[candidates], return_index=True)
+        blocked.append((position, candidates[np.sort(first)]))
+
+    # Only the candidate addresses are turned into strings, all at once
+    if blocked:
+        candidate_rows = [rows for _, rows in blocked]
+        candidate_addresses = _code_strings(lookup_categories, lookup_codes[np.concatenate(candidate_rows)])
+        offsets = np.cumsum([len(rows) for rows in candidate_rows])
+        for (position, rows), addresses in zip(blocked, np.split(candidate_addresses, offsets[:-1])):
+            fuzzy_comparisons.count += len(rows)
+            match = process.extractOne(queries[position], addresses.tolist(), scorer=fuzz.ratio)
+            best_index[position] = rows[match[2]]
+            address_scores[position] = match[1]
+
+    if unblocked and fallback == 'full':
+        unblocked = np.asarray(unblocked)
+        best_index[unblocked], address_scores[unblocked] = best_address_matches(
+            [queries[i] for i in unblocked], lookup_dataset['Address'], chunk_size=chunk_size, workers=workers
+        )
+
+    name_scores = pairwise_name_scores(
+        target_dataset["Owner's Name"], lookup_dataset['Last Name'], best_index, workers=workers,
+        name_matcher=name_matcher,
+    )
+    return build_match_results(lookup_dataset, best_index, address_scores, name_scores)
+
+
+# Function to measure how the blocked matcher compares with the full scan on the same data.
+# Recall is the share of targets whose blocked best address score equals the full scan's.
+def blocking_report(target_dataset, lookup_dataset, max_block_size=MAX_BLOCK_SIZE, fallback='full'):
+    start = time.perf_counter()
+    full_index, full_scores = best_address_matches(target_dataset['Address'], lookup_dataset['Address'])
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    blocking_index = build_blocking_index(lookup_dataset['Address'], max_block_size=max_block_size)
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    blocked = find_best_matches_blocked(target_dataset, lookup_dataset, blocking_index, fallback=fallback)
+    blocked_seconds = time.perf_counter() - start
+
+    queries, query_valid = _string_values(target_dataset['Address'])
+    candidate_counts = [len(blocking_candidates(blocking_index, query)) for query in queries]
+    blocked_scores = score_pairs(
+        queries, blocked['Best Match Address'].astype(str).tolist(), scorer=fuzz.ratio, dtype=np.float64
+    )
+    found = (blocked['Best Match Address'] != 'none').to_numpy()
+    recall = float(np.mean(np.where(found, blocked_scores, 0) >= full_scores)) if len(queries) else 1.0
+
+    return {
+        'targets': len(queries),
+        'lookup rows': len(lookup_dataset),
+        'recall': recall,
+        'mean candidates': float(np.mean(candidate_counts)) if candidate_counts else 0.0,
+        'targets without candidates': int(np.sum(np.asarray(candidate_counts) == 0)),
+        'full scan seconds': full_seconds,
+        'index build seconds': index_seconds,
+        'blocked seconds': blocked_seconds,
+        'speedup': full_seconds / blocked_seconds if blocked_seconds else float('inf'),
+    }
+
+# Function to find the best matches while scoring each distinct address and name pair only once.
+# Target and lookup addresses are deduplicated up front, every distinct target address is scored
+# against the distinct lookup addresses, and the winner is resolved to its first lookup row
+# through an address -> row index. Gives the same result as the full scan.
+def find_best_matches_dedupe(target_dataset, lookup_dataset, chunk_size=None, workers=-1, name_matcher=None):
+    lookup_codes, lookup_addresses = pd.factorize(lookup_dataset['Address'])
+    target_codes, target_addresses = pd.factorize(target_dataset['Address'])
+
+    # First lookup row of every distinct address (factorize numbers them in order of appearance)
+    address_rows = np.flatnonzero(lookup_codes >= 0)
+    address_rows = address_rows[np.unique(lookup_codes[address_rows], return_index=True)[1]]
+
+    best_address, distinct_scores = best_address_matches(
+        target_addresses, lookup_addresses, chunk_size=chunk_size, workers=workers
+    )
+    best_address = np.append(best_address, -1)
+    distinct_scores = np.append(distinct_scores, 0.0)
+    # Targets without an address have code -1, which picks the 'no match' entry appended above
+    best_index = np.where(best_address >= 0, address_rows[best_address], -1)[target_codes]
+    address_scores = distinct_scores[target_codes]
+
+    # Score every distinct (owner's name, matched lookup row) pair once and reuse it for duplicates
+    name_codes, names = pd.factorize(target_dataset["Owner's Name"])
+    rows = len(lookup_dataset) + 1
+    pair_keys, pair_codes = np.unique((name_codes + 1) * rows + (best_index + 1), return_inverse=True)
+    pair_names = np.append(np.asarray(names, dtype=object), None)[pair_keys // rows - 1]
+    name_scores = pairwise_name_scores(
+        pair_names, lookup_dataset['Last Name'], pair_keys % rows - 1, workers=workers,
+        name_matcher=name_matcher,
+    )[pair_codes]
+
+    return build_match_results(lookup_dataset, best_index, address_scores, name_scores)
+
+
+# Character n-gram TF-IDF settings: n-gram length, number of hashed features, and the largest number
+# of lookup addresses an n-gram may appear in before it is ignored. Common n-grams (' stre', or a
+# house number with the start of a common street name) make the sparse products dense, so capping
+# them is what makes retrieval cheap, at some recall: on generated data with 10% typos (3k targets,
+# index build included) the pick equalled the full scan for 100% of targets with 60k lookup rows
+# (1.6s against 3.9s) and 99.3% with 200k rows (1.7s against 10s).
+# 5-grams span the house number and the street name, which keeps enough rare n-grams per address
+# under the cap. Raise the cap for more recall.
+TFIDF_NGRAM = 5
+TFIDF_FEATURES = 2 ** 20
+TFIDF_MAX_POSTINGS = 400
+# Upper bound on the size of one block of the sparse query x lookup similarity product
+TFIDF_BLOCK_BYTES = 256 * 1024 ** 2
+
+
+# Function to count the hashed character n-grams of each address into a sparse matrix (one row per
+# address). The n-grams are read straight off the UTF-32 code points of a fixed-width NumPy string
+# array, so there is no Python loop over the characters.
+def _ngram_counts(addresses, ngram=TFIDF_NGRAM, n_features=TFIDF_FEATURES, block_rows=100000):
+    blocks = []
+    for start in range(0, len(addresses), block_rows):
+        padded = np.char.add(np.char.add(' ', np.asarray(addresses[start:start + block_rows], dtype=str)), ' ')
+        width = padded.dtype.itemsize // 4
+        positions = max(width - ngram + 1, 0)
+        codes = padded.view(np.uint32).reshape(len(padded), width).astype(np.uint64)
+
+        grams = codes[:, :positions].copy()
+        for offset in range(1, ngram):
+            grams = grams * np.uint64(1000003) + codes[:, offset:offset + positions]
+        valid = np.arange(positions) < (np.char.str_len(padded) - ngram + 1)[:, None]
+
+        rows = np.nonzero(valid)[0]
+        columns = (grams[valid] % np.uint64(n_features)).astype(np.int32)
+        counts = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), (rows, columns)), shape=(len(padded), n_features)
+        )
+        counts.sum_duplicates()
+        blocks.append(counts)
+    if not blocks:
+        return sparse.csr_matrix((0, n_features), dtype=np.float32)
+    return sparse.vstack(blocks, format='csr')
+
+
+# Sparse character n-gram TF-IDF vectors of the lookup addresses, for retrieving the top-k most
+# similar lookup addresses of each query by sparse matrix multiplication
+class TfidfIndex:
+    def __init__(self, lookup_addresses, ngram=TFIDF_NGRAM, n_features=TFIDF_FEATURES,
+                 max_postings=TFIDF_MAX_POSTINGS):
+        self.ngram = ngram
+        self.n_features = n_features
+        addresses, _ = _string_values(pd.Series(lookup_addresses))
+        counts = _ngram_counts(addresses, ngram, n_features)
+
+        document_frequency = np.bincount(counts.indices, minlength=n_features)
+        self.idf = (np.log((1 + len(addresses)) / (1 + document_frequency)) + 1).astype(np.float32)
+        self.idf[document_frequency > max_postings] = 0
+        # Number of lookup rows each query n-gram touches, to size the multiplication blocks
+        self.postings = np.where(self.idf > 0, document_frequency, 0)
+        # Transposed (n-gram x lookup row) so that queries @ vectors is a plain CSR product
+        self.vectors = self._weigh(counts).T.tocsr()
+
+    def _weigh(self, counts):
+        weighted = counts.multiply(self.idf).tocsr()
+        weighted.eliminate_zeros()
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms).dot(weighted).astype(np.float32).tocsr()
+
+    # Function to find the top_k most similar lookup rows of every query, as an array of lookup row
+    # positions per query (most similar first, padded with -1)
+    def candidates(self, queries, top_k=10, block_bytes=TFIDF_BLOCK_BYTES):
+        query_vectors = self._weigh(_ngram_counts(queries, self.ngram, self.n_features))
+        # Every nonzero of the product takes about 12 bytes (value, column index and the temporaries)
+        work = (query_vectors > 0).astype(np.int64).dot(self.postings)
+        budget = max(block_bytes // 12, 1)
+
+        candidates = np.full((len(queries), top_k), -1, dtype=np.int64)
+        start = 0
+        while start < len(queries):
+            stop = start + max(1, int(np.searchsorted(np.cumsum(work[start:]), budget, side='right')))
+            similarity = query_vectors[start:stop].dot(self.vectors).tocsr()
+            similarity.eliminate_zeros()
+
+            # Rank the nonzeros of each row by similarity and keep the first top_k of every row
+            rows = np.repeat(np.arange(stop - start), np.diff(similarity.indptr))
+            order = np.lexsort((-similarity.data, rows))
+            rank = np.arange(len(order)) - similarity.indptr[rows[order]]
+            keep = order[rank < top_k]
+            candidates[start + rows[keep], rank[rank < top_k]] = similarity.indices[keep]
+            start = stop
+        return candidates
+
+
+# Function to find the best matches by retrieving the top_k most similar lookup addresses of each
+# target through the TF-IDF index and re-ranking those candidates with fuzz.ratio, so the reported
+# scores are the same kind as the full scan's. Targets without any candidate fall back to a full
+# scan (fallback='full') or no match (fallback='none').
+def find_best_matches_tfidf(target_dataset, lookup_dataset, tfidf_index=None, top_k=10, fallback='full',
+                            chunk_size=None, workers=-1, name_matcher=None):
+    if fallback not in ('full', 'none'):
+        raise ValueError(f"Unknown fallback '{fallback}', expected 'full' or 'none'")
+    if tfidf_index is None:
+        tfidf_index = TfidfIndex(lookup_dataset['Address'])
+
+    queries, query_valid = _string_values(target_dataset['Address'])
+    lookup_codes, lookup_categories = _column_codes(lookup_dataset['Address'])
+
+    candidates = tfidf_index.candidates(queries, top_k)
+    candidates[~query_valid] = -1
+    candidates[candidates >= 0] = np.where(lookup_codes[candidates[candidates >= 0]] >= 0,
+                                           candidates[candidates >= 0], -1)
+    # In lookup order, so ties resolve to the same row as a full scan; missing candidates sort last
+    candidates = np.where(candidates < 0, np.iinfo(np.int64).max, candidates)
+    candidates.sort(axis=1)
+    candidates[candidates == np.iinfo(np.int64).max] = -1
+
+    present = candidates >= 0
+    scores = np.full(candidates.shape, -1.0)
+    # Only the candidate addresses are turned into strings
+    scores[present] = score_pairs(
+        np.repeat(np.asarray(queries, dtype=object), present.sum(axis=1)).tolist(),
+        _code_strings(lookup_categories, lookup_codes[candidates[present]]).tolist(),
+        scorer=fuzz.ratio, dtype=np.float64, workers=workers,
+    )
+    best = scores.argmax(axis=1)
+    best_index = candidates[np.arange(len(queries)), best]
+    address_scores = np.maximum(scores[np.arange(len(queries)), best], 0)
+
+    unmatched = np.flatnonzero((best_index < 0) & query_valid)
+    if len(unmatched) and fallback == 'full':
+        best_index[unmatched], address_scores[unmatched] = best_address_matches(
+            [queries[i] for i in unmatched], lookup_dataset['Address'], chunk_size=chunk_size, workers=workers
+        )
+
+    name_scores = pairwise_name_scores(
+        target_dataset["Owner's Name"], lookup_dataset['Last Name'], best_index, workers=workers,
+        name_matcher=name_matcher,
+    )
+    return build_match_results(lookup_dataset, best_index, address_scores, name_scores)
+
+
+# Function to find the best matches among the top_k best addresses of every target instead of the
+# single best one: the owner's name is scored against the 'Last Name' of every candidate and the
+# candidate with the best combined score wins (the best address when no name matches, like the full
+# scan). The other candidates are added as 'Alternative N ...' columns, best combined score first.
+def find_best_matches_top_k(target_dataset, lookup_dataset, top_k=5, chunk_size=None, workers=-1,
+                            name_matcher=None):
+    candidates, address_scores = find_top_k_candidates(
+        target_dataset['Address'], lookup_dataset['Address'], top_k, chunk_size=chunk_size, workers=workers
+    )
+    name_scores = pairwise_name_scores(
+        np.repeat(target_dataset["Owner's Name"].to_numpy(dtype=object), candidates.shape[1]),
+        lookup_dataset['Last Name'], candidates.ravel(), workers=workers, name_matcher=name_matcher,
+    ).reshape(candidates.shape)
+
+    # Stable sort on the combined score keeps the address order among equal combined scores
+    combined_scores = np.where(candidates >= 0, address_scores * name_scores, -1)
+    order = np.argsort(-combined_scores, axis=1, kind='stable')
+    candidates, address_scores, name_scores = (
+        np.take_along_axis(values, order, axis=1) for values in (candidates, address_scores, name_scores)
+    )
+
+    results = build_match_results(lookup_dataset, candidates[:, 0], address_scores[:, 0], name_scores[:, 0])
+    for rank in range(1, candidates.shape[1]):
+        alternative = build_match_results(
+            lookup_dataset, candidates[:, rank], address_scores[:, rank], name_scores[:, rank]
+        )
+        results[f'Alternative {rank} Address'] = alternative['Best Match Address']
+        results[f'Alternative {rank} Name'] = alternative['Best Match Name']
+        results[f'Alternative {rank} Mobile'] = alternative['Mobile']
+        results[f'Alternative {rank} Score'] = alternative['Combined Score']
+    return results
+
+
+# Street type words with their canonical form: the single word types of ADDRESS_ABBREVIATIONS
+# (both the abbreviation and the full form, in case an address was not standardized) and common
+# types the abbreviation table leaves alone. Words that are not street types on their own are left out.
+STREET_TYPES = {
+    **{full.lower(): full.lower() for full in ADDRESS_ABBREVIATIONS.values() if ' ' not in full},
+    **{abbreviation.lower(): full.lower() for abbreviation, full in ADDRESS_ABBREVIATIONS.items() if ' ' not in full},
+    'way': 'way', 'terrace': 'terrace', 'tce': 'terrace', 'parade': 'parade', 'pde': 'parade',
+    'crescent': 'crescent', 'cres': 'crescent', 'cr': 'crescent', 'grove': 'grove', 'gr': 'grove',
+    'highway': 'highway', 'hwy': 'highway', 'esplanade': 'esplanade', 'esp': 'esplanade',
+    'square': 'square', 'sq': 'square', 'parkway': 'parkway', 'pkwy': 'parkway', 'promenade': 'promenade',
+    'gardens': 'gardens', 'gdns': 'gardens', 'heights': 'heights', 'hts': 'heights', 'rise': 'rise',
+    'crest': 'crest', 'mews': 'mews', 'loop': 'loop', 'quay': 'quay', 'link': 'link', 'mall': 'mall',
+    'glade': 'glade', 'green': 'green', 'ridge': 'ridge', 'row': 'row', 'view': 'view', 'path': 'path',
+}
+# Dropped by their canonical form, so their abbreviations ('w', 'cnr', 'blk', ...) go as well
+NOT_STREET_TYPES = {'west', 'upper', 'central', 'corner', 'block', 'river', 'beach', 'sound', 'towers', 'villas', 'trailer'}
+STREET_TYPES = {word: street_type for word, street_type in STREET_TYPES.items() if street_type not in NOT_STREET_TYPES}
+
+# Unit (as 'unit 3 51', 'u3/51' or '3/51') and house number (or range, '12-14') at the start of an
+# address, followed by the street
+ADDRESS_PATTERN = re.compile(
+    r'^(?:(?:(?:unit|apartment|apt|flat|shop|suite)\b\s*|u(?=\d))(?P<unit>[a-z0-9]+)(?:\s*/\s*|\s+)'
+    r'|(?P<unit_slash>[a-z0-9]+)\s*/\s*)?'
+    r'(?P<number>\d+[a-z]?(?:\s*-\s*\d+[a-z]?)?)\s+(?P<street>.+)$'
+)
+
+
+# Function to parse a standardized (lowercase, comma free) address into its components: (unit,
+# house number, street name, street type, suburb). The street type is the first street type word
+# after the street name, in its canonical form, and the words after it are the suburb.
+# None when there is no house number or no street type (post office boxes, lots, ...).
+def parse_address(address):
+    match = ADDRESS_PATTERN.match(address.strip())
+    if match is None:
+        return None
+    words = match.group('street').split()
+    for position in range(1, len(words)):
+        street_type = STREET_TYPES.get(words[position])
+        if street_type is not None:
+            return (
+                match.group('unit') or match.group('unit_slash') or '',
+                match.group('number').replace(' ', ''),
+                ' '.join(words[:position]),
+                street_type,
+                ' '.join(words[position + 1:]),
+            )
+    return None
+
+
+# Hash indexes over the lookup addresses for exact matching: every distinct address and every
+# distinct parsed address (parse_address) maps to its first lookup row, the row a full scan picks
+# among equal scores. Built once over the lookup addresses.
+class AddressIndex:
+    def __init__(self, lookup_addresses):
+        codes, addresses = pd.factorize(pd.Series(lookup_addresses))
+        # factorize numbers the addresses in order of first appearance, so the first rows are sorted
+        first_rows = np.flatnonzero(codes >= 0)
+        first_rows = first_rows[np.unique(codes[first_rows], return_index=True)[1]]
+        addresses = np.asarray(addresses, dtype=object).tolist()
+        self.rows = dict(zip(addresses, first_rows.tolist()))
+        self.components = {}
+        for address, row in zip(addresses, first_rows.tolist()):
+            components = parse_address(address)
+            if components is not None:
+                self.components.setdefault(components, row)
+
+    # Function to get the lookup row of every target address that has an exact match: the same
+    # address, or else the same components. -1 where there is none.
+    def exact_matches(self, addresses):
+        codes, distinct = pd.factorize(pd.Series(addresses))
+        rows = np.full(len(distinct) + 1, -1, dtype=np.int64)
+        for position, address in enumerate(np.asarray(distinct, dtype=object).tolist()):
+            row = self.rows.get(address)
+            if row is None:
+                components = parse_address(address)
+                row = self.components.get(components, -1) if components is not None else -1
+            rows[position] = row
+        # Missing addresses have code -1, which picks the 'no match' entry at the end
+        return rows[codes]
+
+
+# Function to find the best matches by exact matching first: targets whose address, or parsed
+# address, is in the AddressIndex take that lookup row without any fuzzy search, and only the other
+# targets are scored against every lookup address like the full scan. A different house number or
+# unit is never an exact match, so '12 smith street' no longer loses to a '21 smith street' typo.
+# The address score of an exact match is still its fuzz.ratio score.
+def find_best_matches_exact_first(target_dataset, lookup_dataset, address_index=None, chunk_size=None,
+                                  workers=-1, name_matcher=None):
+    if address_index is None:
+        address_index = AddressIndex(lookup_dataset['Address'])
+    addresses, addresses_valid = _string_values(target_dataset['Address'])
+
+    best_index = address_index.exact_matches(target_dataset['Address'])
+    address_scores = np.zeros(len(best_index), dtype=np.float64)
+    exact = np.flatnonzero(best_index >= 0)
+    if len(exact):
+        lookup_addresses, _ = _string_values(lookup_dataset['Address'].iloc[best_index[exact]])
+        address_scores[exact] = score_pairs(
+            [addresses[i] for i in exact], lookup_addresses, scorer=fuzz.ratio, dtype=np.float64, workers=workers
+        )
+
+    fuzzy = np.flatnonzero((best_index < 0) & addresses_valid)
+    if len(fuzzy):
+        best_index[fuzzy], address_scores[fuzzy] = best_address_matches(
+            [addresses[i] for i in fuzzy], lookup_dataset['Address'], chunk_size=chunk_size, workers=workers
+        )
+
+    name_scores = pairwise_name_scores(
+        target_dataset["Owner's Name"], lookup_dataset['Last Name'], best_index, workers=workers,
+        name_matcher=name_matcher,
+    )
+    return build_match_results(lookup_dataset, best_index, address_scores, name_scores)
+
+
+# The address matchers that can be selected in find_best_matches
+MATCHING_STRATEGIES = {
+    'full': find_best_matches_full,
+    'blocked': find_best_matches_blocked,
+    'dedupe': find_best_matches_dedupe,
+    'tfidf': find_best_matches_tfidf,
+    'top_k': find_best_matches_top_k,
+    'exact_first': find_best_matches_exact_first,
+}
+
+
+# Function to find the best lookup match for every target row with the selected strategy.
+# Every strategy returns the same columns: Best Match Address, Combined Score, Best Match Name, Mobile.
+# name_scorer selects how the owner's name is scored against the matched 'Last Name' (NAME_SCORERS).
+def find_best_matches(target_dataset, lookup_dataset, strategy='full', name_scorer='ratio', **options):
+    if strategy not in MATCHING_STRATEGIES:
+        raise ValueError(f"Unknown matching strategy '{strategy}', expected one of {list(MATCHING_STRATEGIES)}")
+    name_matcher = shared_name_matcher(name_scorer)
+    if name_matcher is not None:
+        options['name_matcher'] = name_matcher
+    return MATCHING_STRATEGIES[strategy](target_dataset, lookup_dataset, **options)
+
+# Lookup dataset and matching options of the current parallel run, set in the parent before the
+# worker processes start so forked workers share them instead of receiving a pickled copy per task
+_worker_lookup = None
+_worker_options = {}
+
+
+# A worker given a lookup cache entry (cache directory and key) instead of a dataset loads it from
+# there: the columns are memory-mapped .npy files, whose pages all the workers share
+def _init_match_worker(lookup_dataset, options, lookup_entry=None):
+    global _worker_lookup, _worker_options
+    if lookup_entry is not None:
+        cache_dir, key = lookup_entry
+        lookup_dataset = LookupCache(cache_dir).load(key)
+        if lookup_dataset is None:
+            raise ValueError("The cached internal dataset was removed while matching, please run again")
+    _worker_lookup, _worker_options = lookup_dataset, options
+
+
+def _match_shard(shard):
+    shard_id, target_shard = shard
+    comparisons = fuzzy_comparisons.count
+    matches = find_best_matches(target_shard, _worker_lookup, **_worker_options)
+    return shard_id, matches, fuzzy_comparisons.count - comparisons
+
+
+# Function to pick the start method of the matching process pool: fork when it is available and
+# this process runs a single thread, otherwise forkserver (or spawn where that is not available).
+# A StageTimer's RssSampler thread is not counted: it only reads /proc and holds no locks a
+# forked worker could need.
+def default_start_method():
+    methods = multiprocessing.get_all_start_methods()
+    threads = [thread for thread in threading.enumerate() if thread.name != RSS_SAMPLER_THREAD]
+    if 'fork' in methods and len(threads) == 1:
+        return 'fork'
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+# Function to run find_best_matches over a process pool. The target dataset is split into shards
+# that are matched in parallel; the lookup dataset reaches the workers through fork. With the other
+# start methods, a lookup dataset loaded from a LookupCache (given as cache and cache_key) is
+# memory-mapped by every worker from the cache entry, and any other is pickled once per worker.
+# progress(rows_done, total_rows) is called as shards finish.
+# Each worker scores with a single thread unless 'workers' is given in the options.
+# start_method picks the multiprocessing start method; by default fork is only used when this
+# process runs a single thread, since forking a threaded process (the Streamlit server, or a
+# MatchingJobs thread) can deadlock the workers. Otherwise forkserver or spawn is used.
+def find_best_matches_parallel(target_dataset, lookup_dataset, processes=None, shard_size=None, progress=None,
+                               start_method=None, cache=None, cache_key=None, **options):
+    processes = processes or os.cpu_count() or 1
+    target_dataset = target_dataset[['Address', "Owner's Name"]].reset_index(drop=True)
+    shard_size = shard_size or max(1, -(-len(target_dataset) // (processes * 4)))
+    shards = [(shard_id, target_dataset.iloc[start:start + shard_size])
+              for shard_id, start in enumerate(range(0, len(target_dataset), shard_size))]
+    if processes == 1 or len(shards) <= 1:
+        matches = find_best_matches(target_dataset, lookup_dataset, **options)
+        if progress:
+            progress(len(matches), len(matches))
+        return matches
+
+    options.setdefault('workers', 1)
+    if options.get('strategy') == 'blocked' and options.get('blocking_index') is None:
+        # Build the index once here rather than once per shard
+        options['blocking_index'] = build_blocking_index(lookup_dataset['Address'])
+    if options.get('strategy') == 'tfidf' and options.get('tfidf_index') is None:
+        options['tfidf_index'] = TfidfIndex(lookup_dataset['Address'])
+    if options.get('strategy') == 'exact_first' and options.get('address_index') is None:
+        options['address_index'] = AddressIndex(lookup_dataset['Address'])
+
+    start_method = start_method or default_start_method()
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        # The fork server imports the matching code once, so the workers it forks start quickly
+        context.set_forkserver_preload([__name__])
+    if start_method == 'fork':
+        _init_match_worker(lookup_dataset, options)
+        pool_arguments = {}
+    elif cache is not None and cache_key is not None:
+        pool_arguments = {'initializer': _init_match_worker, 'initargs': (None, options, (cache.cache_dir, cache_key))}
+    else:
+        pool_arguments = {'initializer': _init_match_worker, 'initargs': (lookup_dataset, options)}
+
+    results = [None] * len(shards)
+    rows_done = 0
+    try:
+        with context.Pool(min(processes, len(shards)), **pool_arguments) as pool:
+            for shard_id, shard_matches, comparisons in pool.imap_unordered(_match_shard, shards):
+                results[shard_id] = shard_matches
+                # The workers' comparisons are counted in their own processes
+                fuzzy_comparisons.count += comparisons
+                rows_done += len(shard_matches)
+                if progress:
+                    progress(rows_done, len(target_dataset))
+    finally:
+        _init_match_worker(None, {})
+
+    return pd.concat(results, ignore_index=True)
+
+
+def standardize_mobile_v2(mobile):
+    if pd.notna(mobile):
+        mobile_str = str(mobile)
+        return ''.join(filter(str.isdigit, mobile_str))
+    return None
+
+
+# Function to standardize a whole column of mobile numbers at once: the digits of each value,
+# and the string 'None' for missing values (the same strings as applying standardize_mobile_v2
+# and casting to str, except that whole numbers stored as floats lose their '.0')
+def standardize_mobile_series(mobiles):
+    text = mobiles.astype(object)
+    if pd.api.types.is_float_dtype(mobiles):
+        # Numbers read as floats (a column with blanks) would otherwise gain a digit from the '.0'
+        text = mobiles.round().astype('Int64').astype(object)
+    digits = text.astype(str).str.replace(r'[^0-9]', '', regex=True)
+    return digits.where(mobiles.notna(), 'None')
+
+
+# Function to turn a buyer list into one row per buyer. Each 'Contact' line is a mobile ('[M]: ...'),
+# an email ('[E]: ...') or 'Do Not Email'; the buyer name is only given on its first line.
+def parse_contact_list(contact_list):
+    contact_list['Name'] = contact_list['Name'].ffill()
+    contact = contact_list['Contact'].astype(object)
+    is_text = contact.map(type) == str
+    contact = contact.where(is_text, '').astype(str)
+    contact_list['Mobile'] = contact.str.replace('[M]:', '', regex=False).str.strip().where(contact.str.contains('[M]:', regex=False))
+    contact_list['Email'] = contact.str.replace('[E]:', '', regex=False).str.strip().where(contact.str.contains('[E]:', regex=False))
+    contact_list['Should I contact?'] = contact.where(contact == 'Do Not Email')
+
+    # Aggregate each buyer's lines, taking the first non-null value of every field
+    grouped_by_name = contact_list.groupby('Name').agg({
+        'Address': 'first',
+        'Mobile': 'first',
+        'Email': 'first',
+        'Should I contact?': 'first'
+    }).reset_index()
+
+    grouped_by_name.fillna({'Should I contact?': 'Yes', 'Mobile': 9999999999}, inplace=True)
+    grouped_by_name['Mobile'] = standardize_mobile_series(grouped_by_name['Mobile'])
+    return grouped_by_name
+
+
+# Number of trailing digits that identify a mobile number, so '0412 345 678', '+61 412 345 678'
+# and '412345678' (a leading zero lost in Excel) are the same number
+MOBILE_KEY_DIGITS = 9
+
+
+# Function to reduce standardized mobile numbers to their last `digits` digits. Shorter numbers are
+# kept whole; missing or empty numbers get an empty key, which never matches.
+def mobile_keys(mobiles, digits=MOBILE_KEY_DIGITS):
+    mobiles = mobiles.where(mobiles != 'None', '')
+    return mobiles.str[-digits:]
+
+
+# Hash index from mobile number to internal dataset address, built once and reusable across runs.
+# Numbers are compared on their last `digits` digits. When several internal rows share a number,
+# keep='last' (like building a dict from the rows) or keep='first' decides which address wins.
+class MobileIndex:
+    def __init__(self, keys, addresses, digits=MOBILE_KEY_DIGITS):
+        self.keys = pd.Index(keys)
+        self.addresses = np.asarray(addresses, dtype=object)
+        self.digits = digits
+
+    @classmethod
+    def from_dataset(cls, internal_dataset, digits=MOBILE_KEY_DIGITS, keep='last'):
+        entries = pd.DataFrame({
+            'Mobile': mobile_keys(standardize_mobile_series(internal_dataset['Mobile']), digits).to_numpy(dtype=object),
+            'Address': internal_dataset['Address'].to_numpy(dtype=object),
+        })
+        entries = entries[entries['Mobile'] != ''].drop_duplicates(subset=['Mobile'], keep=keep)
+        return cls(entries['Mobile'].to_numpy(dtype=object), entries['Address'], digits)
+
+    def to_frame(self):
+        return pd.DataFrame({'Mobile': self.keys.to_numpy(dtype=object), 'Address': self.addresses})
+
+    # Addresses for a column of standardized mobile numbers (NaN where the number is not indexed)
+    def lookup(self, mobiles):
+        positions = self.keys.get_indexer(mobile_keys(mobiles, self.digits).to_numpy(dtype=object))
+        addresses = np.append(self.addresses, np.nan)[positions]
+        return pd.Series(addresses.tolist(), index=mobiles.index)
+
+
+# Function to load the mobile index of an internal dataset file from the lookup cache, building
+# and caching it the first time the file is seen
+def load_mobile_index(file, cache=None, digits=MOBILE_KEY_DIGITS, keep='last'):
+    cache = cache or LookupCache()
+    if hasattr(file, 'getvalue'):
+        data = file.getvalue()
+    else:
+        with open(file, 'rb') as handle:
+            data = handle.read()
+    key = cache.key(f'mobile index:{digits}:{keep}:'.encode() + data)
+
+    entries = cache.load(key)
+    if entries is not None:
+        return MobileIndex(entries['Mobile'].to_numpy(dtype=object), entries['Address'], digits)
+
+    mobile_index = MobileIndex.from_dataset(clean_column_names(read_dataset(file)), digits=digits, keep=keep)
+    cache.save(key, mobile_index.to_frame())
+    return mobile_index
+
+
+# Function to fill in buyer addresses from the internal dataset wherever the buyer's mobile number
+# is found in the mobile index, flagging those rows in 'Found a Match'
+def match_buyer_addresses(grouped_by_name, mobile_index):
+    matched_addresses = mobile_index.lookup(grouped_by_name['Mobile'])
+    grouped_by_name['Address'] = matched_addresses.fillna(grouped_by_name['Address'])
+    grouped_by_name['Found a Match'] = matched_addresses.notna()
+    return grouped_by_name
+
+
+# Where preprocessed lookup datasets are cached, and how much disk the cache may use
+LOOKUP_CACHE_DIR = os.environ.get('MATCHPOINT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'matchpoint'))
+LOOKUP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Bump when prepare_lookup_dataset or the cached layout changes so old entries are not reused
+LOOKUP_CACHE_VERSION = 2
+# The lookup columns the matchers read
+LOOKUP_CACHE_COLUMNS = ['Address', 'Full Name', 'Last Name', 'Mobile']
+
+
+# On-disk cache of normalized lookup datasets (and their blocking indexes), keyed by a hash of
+# the raw uploaded file. Every column is stored as a .npy file that is memory-mapped on load;
+# interned text columns as their codes plus the distinct values in UTF-8 buffers (see text_buffers),
+# other text columns as fixed-width unicode with a separate null mask.
+# The least recently used entries are evicted once the cache grows beyond max_bytes.
+class LookupCache:
+    def __init__(self, cache_dir=LOOKUP_CACHE_DIR, max_bytes=LOOKUP_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(data):
+        digest = hashlib.sha256(f'v{LOOKUP_CACHE_VERSION}:'.encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _load_array(self, path):
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+
+    def load(self, key):
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as handle:
+                meta = json.load(handle)
+            columns = {}
+            for position, column in enumerate(meta['columns']):
+                values = self._load_array(os.path.join(entry, f'{position}.npy'))
+                if column in meta.get('interned', []):
+                    categories = text_values(self._load_array(os.path.join(entry, f'{position}.values.npy')),
+                                             self._load_array(os.path.join(entry, f'{position}.offsets.npy')))
+                    columns[column] = distinct_categorical_column(values, categories)
+                    continue
+                if column in meta['null_masks']:
+                    values = values.astype(object)
+                    values[self._load_array(os.path.join(entry, f'{position}.isna.npy'))] = np.nan
+                columns[column] = pd.Series(values.tolist() if values.dtype == object else values)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        os.utime(os.path.join(entry, 'meta.json'))
+        return pd.DataFrame(columns, copy=False)
+
+    def save(self, key, lookup_dataset):
+        entry = self._entry(key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.cache_dir, prefix='.staging-')
+        try:
+            columns = [column for column in LOOKUP_CACHE_COLUMNS if column in lookup_dataset.columns]
+            null_masks = []
+            interned = []
+            for position, column in enumerate(columns):
+                values = lookup_dataset[column]
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    # Interned columns keep their codes, and every distinct value is stored once
+                    np.save(os.path.join(staging, f'{position}.npy'), values.cat.codes.to_numpy())
+                    data, offsets = text_buffers(values.cat.categories)
+                    np.save(os.path.join(staging, f'{position}.values.npy'), data)
+                    np.save(os.path.join(staging, f'{position}.offsets.npy'), offsets)
+                    interned.append(column)
+                    continue
+                if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                    np.save(os.path.join(staging, f'{position}.npy'), values.to_numpy())
+                    continue
+                isna = values.isna().to_numpy()
+                np.save(os.path.join(staging, f'{position}.npy'), values.where(~isna, '').map(str).to_numpy(dtype=str))
+                np.save(os.path.join(staging, f'{position}.isna.npy'), isna)
+                null_masks.append(column)
+
+            with open(os.path.join(staging, 'meta.json'), 'w') as handle:
+                json.dump({'columns': columns, 'null_masks': null_masks, 'interned': interned,
+                           'rows': len(lookup_dataset)}, handle)
+
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(staging, entry)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=key)
+
+    def load_blocking_index(self, key, max_block_size=MAX_BLOCK_SIZE):
+        prefix = os.path.join(self._entry(key), f'blocking_{max_block_size}')
+        try:
+            keys = self._load_array(f'{prefix}_keys.npy')
+            offsets = self._load_array(f'{prefix}_offsets.npy')
+            rows = self._load_array(f'{prefix}_rows.npy')
+        except (OSError, ValueError):
+            return None
+        return {key: rows[offsets[i]:offsets[i + 1]] for i, key in enumerate(keys.tolist())}
+
+    def save_blocking_index(self, key, blocking_index, max_block_size=MAX_BLOCK_SIZE):
+        entry = self._entry(key)
+        if not os.path.isdir(entry):
+            return
+        prefix = os.path.join(entry, f'blocking_{max_block_size}')
+        keys = list(blocking_index)
+        lengths = [len(blocking_index[k]) for k in keys]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        rows = np.concatenate([blocking_index[k] for k in keys]) if keys else np.empty(0, dtype=np.int64)
+        # The offsets are written last: load_blocking_index treats a missing file as no index
+        np.save(f'{prefix}_keys.npy', np.asarray(keys, dtype=str))
+        np.save(f'{prefix}_rows.npy', rows)
+        np.save(f'{prefix}_offsets.npy', offsets)
+        self.evict(keep=key)
+
+    # Remove the least recently used entries until the cache fits in max_bytes; the keep entry
+    # (the one just written) always stays
+    def evict(self, keep=None):
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            meta = os.path.join(entry, 'meta.json')
+            if name.startswith('.') or not os.path.isfile(meta):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(meta), size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name != keep:
+                shutil.rmtree(self._entry(name), ignore_errors=True)
+                total -= size
+
+
+# Function to load the normalized (and interned) lookup dataset for an uploaded file, from the
+# cache when the same file was processed before. Returns the dataset and its cache key.
+def load_lookup_dataset(file, cache=None):
+    cache = cache or LookupCache()
+    if hasattr(file, 'getvalue'):
+        data = file.getvalue()
+    else:
+        with open(file, 'rb') as handle:
+            data = handle.read()
+    key = cache.key(data)
+
+    lookup_dataset = cache.load(key)
+    if lookup_dataset is None:
+        cache.save(key, intern_lookup_dataset(prepare_lookup_dataset(read_dataset(file))))
+        # Served from the entry just written, so the first run gets the same columns and values
+        # (a mixed 'Mobile' column stored as text, for example) as the runs that find it cached
+        lookup_dataset = cache.load(key)
+    # Entries cached before interning hold plain text columns
+    return intern_lookup_dataset(lookup_dataset), key
+
+
+# Function to get the blocking index of a cached lookup dataset, building and caching it if needed
+def load_blocking_index(lookup_dataset, key, cache=None, max_block_size=MAX_BLOCK_SIZE):
+    cache = cache or LookupCache()
+    blocking_index = cache.load_blocking_index(key, max_block_size=max_block_size)
+    if blocking_index is None:
+        blocking_index = build_blocking_index(lookup_dataset['Address'], max_block_size=max_block_size)
+        cache.save_blocking_index(key, blocking_index, max_block_size=max_block_size)
+    return blocking_index
+
+
+# Bump when the record hashes or the stored layout of a MatchStore change
+MATCH_STORE_VERSION = 1
+# The columns that identify a target and a lookup record for incremental matching
+TARGET_RECORD_COLUMNS = ['Address', "Owner's Name"]
+LOOKUP_RECORD_COLUMNS = ['Address', 'Last Name', 'Full Name', 'Mobile']
+
+
+# Function to hash every normalized record (row) of a dataset into a uint64 over the given columns.
+# Values are hashed as text so the same record hashes the same whether it was read from the file or
+# from the lookup cache.
+def record_hashes(dataset, columns):
+    text = pd.DataFrame({column: dataset[column].map(str).to_numpy(dtype=object) for column in columns})
+    return pd.util.hash_pandas_object(text, index=False).to_numpy()
+
+
+# On-disk store of the last full set of matches for incremental matching: the record hashes of the
+# lookup dataset, and for every distinct target record its best lookup record and scores.
+# Arrays are stored as .npy files and replaced together through a staging directory. The store
+# directory is replaced on every save, so only a new or empty directory, or an existing match store,
+# is accepted as path.
+class MatchStore:
+    FIELDS = ['lookup_keys', 'target_keys', 'best_keys', 'matched', 'address_scores', 'name_scores']
+
+    def __init__(self, path):
+        self.path = path
+        self.check()
+
+    # Function to make sure the store directory can be replaced: raises ValueError when it holds
+    # anything but a match store
+    def check(self):
+        if not os.path.exists(self.path):
+            return
+        if not os.path.isdir(self.path):
+            raise ValueError(f"Match store '{self.path}' is not a directory")
+        entries = set(os.listdir(self.path))
+        if not entries:
+            return
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as handle:
+                is_store = 'version' in json.load(handle)
+        except (OSError, ValueError, TypeError):
+            is_store = False
+        if not is_store or not entries <= {'meta.json'} | {f'{field}.npy' for field in self.FIELDS}:
+            raise ValueError(f"'{self.path}' is not a match store, use a new or empty directory for --store")
+
+    def load(self):
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as handle:
+                meta = json.load(handle)
+            if meta.get('version') != MATCH_STORE_VERSION:
+                return None
+            state = {field: np.load(os.path.join(self.path, f'{field}.npy'), allow_pickle=False)
+                     for field in self.FIELDS}
+            state['name_scorer'] = meta.get('name_scorer', 'ratio')
+            return state
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, state):
+        self.check()
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent, prefix='.staging-')
+        try:
+            for field in self.FIELDS:
+                np.save(os.path.join(staging, f'{field}.npy'), state[field])
+            with open(os.path.join(staging, 'meta.json'), 'w') as handle:
+                json.dump({'version': MATCH_STORE_VERSION, 'targets': len(state['target_keys']),
+                           'name_scorer': state.get('name_scorer', 'ratio')}, handle)
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.replace(staging, self.path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+# Function to find the best matches (the same as the full scan) while reusing the matches kept in a
+# MatchStore by the previous run. Only new or changed targets, and targets whose matched lookup
+# record is gone, are scored against the whole lookup dataset; the other targets are only scored
+# against the lookup rows added since. The store is then updated to this run. The numbers of
+# targets rescored and rechecked are in the results' attrs['incremental']. When the store was made
+# with another name_scorer only the names of the kept targets are scored again.
+def find_best_matches_incremental(target_dataset, lookup_dataset, store, chunk_size=None, workers=-1,
+                                  name_scorer='ratio'):
+    name_matcher = shared_name_matcher(name_scorer)
+    lookup_keys = record_hashes(lookup_dataset, LOOKUP_RECORD_COLUMNS)
+    # First row of every lookup record, which is the row the full scan picks among equal records
+    distinct_lookup, first_rows = np.unique(lookup_keys, return_index=True)
+    target_codes, target_keys = pd.factorize(record_hashes(target_dataset, TARGET_RECORD_COLUMNS))
+    target_keys = np.asarray(target_keys, dtype=np.uint64)
+    target_rows = np.unique(target_codes, return_index=True)[1]
+    addresses = target_dataset['Address'].iloc[target_rows].reset_index(drop=True)
+    names = target_dataset["Owner's Name"].iloc[target_rows].reset_index(drop=True)
+
+    best_index = np.full(len(target_keys), -1, dtype=np.int64)
+    address_scores = np.zeros(len(target_keys))
+    name_scores = np.zeros(len(target_keys))
+
+    # Targets kept from the previous run: same record, and the matched lookup record still exists
+    previous = store.load()
+    if previous is not None and not len(previous['target_keys']):
+        # A store without targets (from an empty target file) has nothing to reuse
+        previous = None
+    kept = np.zeros(len(target_keys), dtype=bool)
+    added_rows = np.arange(len(lookup_keys))
+    if previous is not None:
+        positions = np.searchsorted(previous['target_keys'], target_keys)
+        positions = np.minimum(positions, len(previous['target_keys']) - 1)
+        known = previous['target_keys'][positions] == target_keys
+        found = np.searchsorted(distinct_lookup, previous['best_keys'][positions])
+        found = np.minimum(found, max(len(distinct_lookup) - 1, 0))
+        still_there = distinct_lookup[found] == previous['best_keys'][positions] if len(distinct_lookup) else kept
+        matched = previous['matched'][positions]
+        kept = known & (~matched | still_there)
+        # Equal scores go to the first lookup row, so if the rows both runs share were reordered the
+        # kept matches could differ from a full scan and everything is rescored
+        previous_keys, previous_rows = np.unique(previous['lookup_keys'], return_index=True)
+        shared_now = lookup_keys[np.sort(first_rows[np.isin(distinct_lookup, previous_keys)])]
+        shared_before = previous['lookup_keys'][np.sort(previous_rows[np.isin(previous_keys, distinct_lookup)])]
+        if not np.array_equal(shared_now, shared_before):
+            kept[:] = False
+
+        best_index[kept] = np.where(matched[kept], first_rows[found[kept]], -1)
+        address_scores[kept] = previous['address_scores'][positions[kept]]
+        name_scores[kept] = previous['name_scores'][positions[kept]]
+        added_rows = np.flatnonzero(~np.isin(lookup_keys, previous['lookup_keys']))
+
+    # New and changed targets are scored against the whole lookup dataset
+    rescore = np.flatnonzero(~kept)
+    if len(rescore):
+        best_index[rescore], address_scores[rescore] = best_address_matches(
+            addresses.iloc[rescore], lookup_dataset['Address'], chunk_size=chunk_size, workers=workers
+        )
+
+    # Kept targets only need to be scored against the added lookup rows; an added row takes over the
+    # match when it scores higher, or the same but comes first in the lookup dataset
+    recheck = np.flatnonzero(kept)
+    updated = np.empty(0, dtype=np.int64)
+    if len(recheck) and len(added_rows):
+        added_index, added_scores = best_address_matches(
+            addresses.iloc[recheck], lookup_dataset['Address'].iloc[added_rows], chunk_size=chunk_size,
+            workers=workers,
+        )
+        current = best_index[recheck]
+        added_index = np.where(added_index >= 0, added_rows[np.maximum(added_index, 0)], -1)
+        better = (added_index >= 0) & (
+            (current < 0) | (added_scores > address_scores[recheck])
+            | ((added_scores == address_scores[recheck]) & (added_index < current))
+        )
+        updated = recheck[better]
+        best_index[updated] = added_index[better]
+        address_scores[updated] = added_scores[better]
+
+    changed = np.concatenate([rescore, updated])
+    if previous is not None and previous['name_scorer'] != name_scorer:
+        changed = np.arange(len(target_keys))
+    name_scores[changed] = pairwise_name_scores(
+        names.iloc[changed], lookup_dataset['Last Name'], best_index[changed], workers=workers,
+        name_matcher=name_matcher,
+    )
+
+    order = np.argsort(target_keys)
+    store.save({
+        'lookup_keys': lookup_keys,
+        'target_keys': target_keys[order],
+        'best_keys': np.where(best_index >= 0, lookup_keys[np.maximum(best_index, 0)], 0)[order].astype(np.uint64),
+        'matched': (best_index >= 0)[order],
+        'address_scores': address_scores[order],
+        'name_scores': name_scores[order],
+        'name_scorer': name_scorer,
+    })
+
+    results = build_match_results(
+        lookup_dataset, best_index[target_codes], address_scores[target_codes], name_scores[target_codes]
+    )
+    results.attrs['incremental'] = {
+        'targets': len(target_dataset), 'rescored': len(rescore), 'rechecked': len(recheck) if len(added_rows) else 0,
+        'updated': len(updated),
+        'lookup rows added': len(added_rows),
+    }
+    return results
+
+
+# Number of target rows read, matched and written at a time in streaming mode
+STREAM_CHUNK_SIZE = 10000
+# Output formats for the matching results; parquet only when pyarrow is installed
+RESULT_FORMATS = ['xlsx', 'csv'] + (['parquet'] if pq is not None else [])
+
+
+# Function to read an Excel/CSV file as a sequence of DataFrames of at most chunk_size rows.
+# CSV files are read with pandas' chunked reader, Excel files through openpyxl's read-only mode,
+# so only one chunk of the file is held in memory.
+def iter_dataset_chunks(file, chunk_size=STREAM_CHUNK_SIZE, skiprows=0):
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    name = getattr(file, 'name', str(file))
+    if name.endswith('.csv'):
+        yield from pd.read_csv(file, chunksize=chunk_size, skiprows=skiprows)
+        return
+    if not name.endswith('.xlsx'):
+        raise ValueError("Invalid file format. Please upload an Excel file.")
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        for _ in range(skiprows):
+            next(rows, None)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [f'Unnamed: {i}' if column is None else str(column) for i, column in enumerate(header)]
+        chunk = []
+        for row in rows:
+            chunk.append(row[:len(header)])
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+# Writes a result table to an .xlsx, .csv or .parquet file (or buffer) one DataFrame chunk at a time.
+# Excel output uses openpyxl's write-only mode, so rows are streamed to disk rather than kept
+# as cell objects, and confidence_column (if given) is coloured by conditional formatting.
+# Parquet output needs the optional pyarrow package.
+class ResultWriter:
+    def __init__(self, output, output_format='xlsx', confidence_column=None):
+        if output_format not in RESULT_FORMATS:
+            raise ValueError(f"Unknown output format '{output_format}', expected one of {RESULT_FORMATS}")
+        self.output = output
+        self.output_format = output_format
+        self.confidence_column = confidence_column
+        self.columns = None
+        self.rows_written = 0
+        if output_format == 'xlsx':
+            self.workbook = Workbook(write_only=True)
+            self.worksheet = self.workbook.create_sheet('Sheet1')
+        elif output_format == 'csv':
+            self.handle = open(output, 'w', newline='') if isinstance(output, (str, os.PathLike)) else output
+        else:
+            self.parquet_writer = None
+
+    # Function to convert a chunk to an Arrow table with a schema that every chunk fits: the score
+    # columns are doubles and every other column is text. A column's type cannot be taken from the
+    # first chunk, since it may be empty there and hold text later, or mix numbers with text
+    # ('none' among the mobile numbers of the matches).
+    def _parquet_table(self, chunk):
+        if self.parquet_writer is None:
+            self.parquet_schema = pa.schema([
+                (column, pa.float64() if str(column).endswith('Score') else pa.string()) for column in self.columns
+            ])
+        arrays = []
+        for field in self.parquet_schema:
+            values = chunk[field.name]
+            if pa.types.is_string(field.type):
+                text = np.full(len(values), None, dtype=object)
+                present = values.notna().to_numpy()
+                text[present] = values[present].astype(object).map(str).to_numpy(dtype=object)
+                values = text
+            arrays.append(pa.array(values, type=field.type, from_pandas=True))
+        return pa.Table.from_arrays(arrays, schema=self.parquet_schema)
+
+    def write(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            if self.output_format == 'xlsx':
+                self.worksheet.append(self.columns)
+        chunk = chunk[self.columns]
+
+        if self.output_format == 'xlsx':
+            # Missing values are written as empty cells, like DataFrame.to_excel does
+            for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None):
+                self.worksheet.append(row)
+        elif self.output_format == 'csv':
+            chunk.to_csv(self.handle, header=self.rows_written == 0, index=False)
+        else:
+            table = self._parquet_table(chunk)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.output, self.parquet_schema)
+            self.parquet_writer.write_table(table)
+        self.rows_written += len(chunk)
+
+    def close(self):
+        if self.output_format == 'xlsx':
+            if self.columns is None:
+                self.worksheet.append([])
+            elif self.confidence_column in self.columns:
+                add_confidence_formatting(self.worksheet, self.columns.index(self.confidence_column) + 1,
+                                          self.rows_written + 1)
+            self.workbook.save(self.output)
+        elif self.output_format == 'csv':
+            if self.handle is not self.output:
+                self.handle.close()
+        elif self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Function to run the dashboard_1 matching over a target file of any size with bounded memory.
+# The targets are read and matched chunk by chunk. Only the id of each target's match (and of its
+# alternatives with the top_k strategy) and its combined score are kept, because normalizing the
+# score and suppressing duplicate addresses need every target. The file is then read a second time
+# and the finished rows are written to output chunk by chunk. Rows keep the input order, they are
+# not sorted by score.
+# progress(stage, rows_done) is called after every chunk with stage 'matching' or 'writing'.
+# With processes > 1 every chunk is matched by find_best_matches_parallel, and the workers load
+# the lookup dataset from its LookupCache entry when cache and cache_key are given.
+def match_in_chunks(target_file, lookup_dataset, output, output_format='xlsx', chunk_size=STREAM_CHUNK_SIZE,
+                    progress=None, processes=1, cache=None, cache_key=None, **match_options):
+    matches = {}
+    match_ids = []
+    combined_scores = []
+    # The top_k strategy's alternatives are kept the same way: a match id and a score per rank
+    alternative_ids = {}
+    alternative_scores = {}
+    rows_done = 0
+
+    def intern(addresses, names, mobiles):
+        records = zip(addresses, names, mobiles)
+        return np.fromiter((matches.setdefault(record, len(matches)) for record in records),
+                           dtype=np.int64, count=len(addresses))
+
+    for chunk in iter_dataset_chunks(target_file, chunk_size):
+        chunk = prepare_target_dataset(chunk)
+        if processes > 1:
+            chunk_matches = find_best_matches_parallel(chunk, lookup_dataset, processes=processes, cache=cache,
+                                                       cache_key=cache_key, **match_options)
+        else:
+            chunk_matches = find_best_matches(chunk, lookup_dataset, **match_options)
+        match_ids.append(intern(chunk_matches['Best Match Address'], chunk_matches['Best Match Name'],
+                                chunk_matches['Mobile']))
+        combined_scores.append(chunk_matches['Combined Score'].to_numpy(dtype=np.float64))
+        ranks = [int(column.split()[1]) for column in chunk_matches.columns
+                 if column.startswith('Alternative ') and column.endswith(' Address')]
+        for rank in ranks:
+            prefix = f'Alternative {rank} '
+            alternative_ids.setdefault(rank, []).append(intern(
+                chunk_matches[prefix + 'Address'], chunk_matches[prefix + 'Name'], chunk_matches[prefix + 'Mobile']
+            ))
+            alternative_scores.setdefault(rank, []).append(chunk_matches[prefix + 'Score'].to_numpy(dtype=np.float64))
+        rows_done += len(chunk)
+        if progress:
+            progress('matching', rows_done)
+
+    match_ids = np.concatenate(match_ids) if match_ids else np.empty(0, dtype=np.int64)
+    alternative_ids = {rank: np.concatenate(ids) for rank, ids in alternative_ids.items()}
+    alternative_scores = {rank: np.concatenate(scores) for rank, scores in alternative_scores.items()}
+    combined_scores = normalize_combined_score(np.concatenate(combined_scores)) if combined_scores else np.empty(0)
+    records = list(matches)
+    match_addresses = np.asarray([record[0] for record in records], dtype=object)
+    is_duplicate = duplicate_matches(combined_scores, match_addresses[match_ids])
+
+    rows_done = 0
+    with ResultWriter(output, output_format) as writer:
+        for chunk in iter_dataset_chunks(target_file, chunk_size):
+            chunk = prepare_target_dataset(chunk)
+            rows = slice(rows_done, rows_done + len(chunk))
+            chunk_records = [records[i] for i in match_ids[rows]]
+            chunk['Best Match Address'] = [record[0] for record in chunk_records]
+            chunk['Best Match Name'] = [record[1] for record in chunk_records]
+            chunk['Combined Score'] = combined_scores[rows]
+            chunk['Mobile'] = [record[2] for record in chunk_records]
+            chunk['Confidence'] = chunk['Combined Score'].apply(confidence)
+            for rank in sorted(alternative_ids):
+                alternative_records = [records[i] for i in alternative_ids[rank][rows]]
+                chunk[f'Alternative {rank} Address'] = [record[0] for record in alternative_records]
+                chunk[f'Alternative {rank} Name'] = [record[1] for record in alternative_records]
+                chunk[f'Alternative {rank} Mobile'] = [record[2] for record in alternative_records]
+                chunk[f'Alternative {rank} Score'] = alternative_scores[rank][rows]
+
+            writer.write(suppress_duplicate_matches(chunk, is_duplicate[rows]))
+            rows_done += len(chunk)
+            if progress:
+                progress('writing', rows_done)
+
+    return rows_done
+
+
+# Profilers that StageTimer can run around the profiled stages; 'pyinstrument' only when installed
+PROFILERS = ['cprofile'] + (['pyinstrument'] if SamplingProfiler is not None else [])
+
+
+# Function to read a memory field of a process from /proc/<pid>/status in MB, None when it is gone:
+# 'VmRSS' is its resident memory now, 'VmHWM' the peak since it started or its peak was reset
+def process_memory_mb(pid='self', field='VmRSS'):
+    try:
+        with open(f'/proc/{pid}/status') as handle:
+            for line in handle:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+# Function to list the descendant processes of a process from /proc. The matching workers are
+# children of this process with fork, and children of the fork server with forkserver.
+def descendant_pids(pid='self'):
+    pids = []
+    try:
+        tasks = os.listdir(f'/proc/{pid}/task')
+    except OSError:
+        return pids
+    for task in tasks:
+        try:
+            with open(f'/proc/{pid}/task/{task}/children') as handle:
+                children = handle.read().split()
+        except OSError:
+            continue
+        for child in children:
+            pids.append(child)
+            pids.extend(descendant_pids(child))
+    return pids
+
+
+# Function to get the peak resident memory of the largest finished child process so far in MB,
+# None without the resource module
+def finished_child_peak_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+
+
+# Name of the RssSampler threads, which default_start_method does not count
+RSS_SAMPLER_THREAD = 'rss-sampler'
+
+
+# Measures the peak resident memory of this process, and of the largest process started while it
+# runs (the matching workers), over one stage; the kernel's ru_maxrss covers the whole life of the
+# process instead. The process's peak counter (VmHWM) is reset when sampling starts, so later
+# readings only cover the stage, and a background thread samples every `interval` seconds in case
+# another stage resets it meanwhile (concurrent jobs share the process, and so its memory).
+# Workers that exit between two samples are still counted when this process reaped them (fork) and
+# one of them was the largest child so far. Needs /proc (Linux); elsewhere the peaks are None.
+class RssSampler:
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_mb = None
+        self.peak_worker_mb = None
+        self._peak_field = 'VmRSS'
+        self._existing_pids = set()
+        self._finished_child_peak = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        rss = process_memory_mb(field=self._peak_field)
+        if rss is None:
+            return
+        self.peak_mb = max(self.peak_mb or 0.0, rss)
+        workers = [process_memory_mb(pid, 'VmHWM') for pid in descendant_pids() if pid not in self._existing_pids]
+        workers = [rss for rss in workers if rss is not None]
+        if workers:
+            self.peak_worker_mb = max(self.peak_worker_mb or 0.0, max(workers))
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if not os.path.exists('/proc/self/status'):
+            return self
+        try:
+            # '5' resets the peak resident memory of the process (Linux 4.0 and later)
+            with open('/proc/self/clear_refs', 'w') as handle:
+                handle.write('5')
+            self._peak_field = 'VmHWM'
+        except OSError:
+            pass
+        self._existing_pids = set(descendant_pids())
+        self._finished_child_peak = finished_child_peak_mb()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name=RSS_SAMPLER_THREAD, daemon=True)
+        self._thread.start()
+        return self
+
+    # Stops sampling and returns the peaks of this process and of its largest worker, in MB
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self.sample()
+            finished = finished_child_peak_mb()
+            if finished is not None and finished > self._finished_child_peak:
+                self.peak_worker_mb = max(self.peak_worker_mb or 0.0, finished)
+        return self.peak_mb, self.peak_worker_mb
+
+
+# Records each stage of a run: wall and CPU time (including finished worker processes), rows/sec,
+# fuzzy comparisons, the peak RSS of the process and of its largest worker process (sampled by an
+# RssSampler) and, with trace_memory, the peak of Python allocations during the stage.
+# With a profiler ('cprofile' or 'pyinstrument') the stages named in profile_stages are also
+# profiled and the report is kept in profiles.
+class StageTimer:
+    def __init__(self, trace_memory=False, profiler=None, profile_stages=('matching',)):
+        if profiler is not None and profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler '{profiler}', expected one of {', '.join(PROFILERS)}")
+        self.trace_memory = trace_memory
+        self.profiler = profiler
+        self.profile_stages = profile_stages
+        self.stages = {}
+        self.profiles = {}
+
+    # Times the body of a with block as the named stage; the yielded dict takes the row count
+    # ('rows') when it is only known inside the block
+    @contextmanager
+    def stage(self, name, rows=None):
+        stage = {'rows': rows}
+        profiler = self._start_profiler() if name in self.profile_stages else None
+        if self.trace_memory:
+            tracemalloc.start()
+        comparisons = fuzzy_comparisons.count
+        rss_sampler = RssSampler().start()
+        cpu = sum(os.times()[:4])
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            seconds = time.perf_counter() - start
+            stage['seconds'] = seconds
+            stage['cpu_seconds'] = sum(os.times()[:4]) - cpu
+            stage['rows_per_second'] = stage['rows'] / seconds if stage['rows'] is not None and seconds else None
+            stage['fuzzy_comparisons'] = fuzzy_comparisons.count - comparisons
+            stage['peak_rss_mb'], stage['peak_worker_rss_mb'] = rss_sampler.stop()
+            if self.trace_memory:
+                stage['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                tracemalloc.stop()
+            if profiler is not None:
+                self.profiles[name] = self._stop_profiler(profiler)
+            self.stages[name] = stage
+
+    def run(self, name, rows, function, *args, **kwargs):
+        with self.stage(name, rows):
+            return function(*args, **kwargs)
+
+    def _start_profiler(self):
+        if self.profiler is None:
+            return None
+        if self.profiler == 'pyinstrument':
+            profiler = SamplingProfiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, profiler):
+        if self.profiler == 'pyinstrument':
+            profiler.stop()
+            return profiler.output_text()
+        profiler.disable()
+        report = StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(30)
+        return report.getvalue()
+
+    # Function to get the stages as a DataFrame, one row per stage in the order they ran
+    def to_frame(self):
+        return pd.DataFrame.from_dict(self.stages, orient='index')
+
+    # Function to get the structured record of the run (for a JSON log line); extra fields, such
+    # as the command and its parameters, are included as given
+    def record(self, **fields):
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            **fields,
+            'stages': self.stages,
+            'total_seconds': sum(stage['seconds'] for stage in self.stages.values()),
+            'fuzzy_comparisons': sum(stage['fuzzy_comparisons'] for stage in self.stages.values()),
+            'profiles': self.profiles,
+        }
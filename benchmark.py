@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from openpyxl.styles import PatternFill
+
+from Functions import (
+    AddressStandardizer, MATCHING_STRATEGIES, PROFILERS, StageTimer, create_styled_excel, find_best_matches,
+    finalize_matches, prepare_lookup_dataset, prepare_target_dataset, read_dataset,
+)
+
+
+# Building blocks for the synthetic Australian-style datasets
+STREET_NAMES = [
+    'george', 'pitt', 'king', 'queen', 'elizabeth', 'victoria', 'albert', 'church', 'high', 'park',
+    'station', 'railway', 'beach', 'hill', 'river', 'bay', 'ocean', 'smith', 'wattle', 'banksia',
+    'acacia', 'waratah', 'gum', 'jacaranda', 'bottlebrush', 'kookaburra', 'wallaby', 'koala', 'emu',
+    'lachlan', 'macquarie', 'hume', 'flinders', 'cook', 'phillip', 'bligh', 'hunter', 'darling',
+    'murray', 'oxley', 'sturt', 'forbes', 'bourke', 'collins', 'swanston', 'lonsdale', 'chapel',
+    'sydney', 'melbourne', 'brisbane', 'adelaide', 'hobart', 'perth', 'canberra', 'mitchell', 'lawson',
+]
+# Street type as written in the internal dataset -> as written in the target dataset
+STREET_TYPES = [
+    ('St', 'Street'), ('Rd', 'Road'), ('Ave', 'Avenue'), ('Pl', 'Place'), ('Dr', 'Drive'),
+    ('Ln', 'Lane'), ('Ct', 'Court'), ('Cct', 'Circuit'), ('Cl', 'Close'), ('Bvd', 'Boulevard'),
+    ('Cres', 'Cres'), ('Way', 'Way'), ('Pde', 'Pde'), ('Tce', 'Tce'),
+]
+SUBURB_PARTS = [
+    'bon', 'man', 'par', 'ramat', 'pen', 'rith', 'ry', 'de', 'horns', 'by', 'cro', 'nul', 'la',
+    'chats', 'wood', 'liver', 'pool', 'black', 'town', 'ep', 'ping', 'strath', 'field', 'new',
+    'glen', 'ash', 'mount', 'vale', 'dale', 'ford', 'ton', 'ham', 'ley', 'mere', 'brook',
+]
+FIRST_NAMES = [
+    'john', 'mary', 'peter', 'sarah', 'david', 'emma', 'james', 'olivia', 'michael', 'chloe',
+    'william', 'jessica', 'thomas', 'emily', 'daniel', 'sophie', 'matthew', 'grace', 'andrew', 'ruby',
+]
+LAST_NAMES = [
+    'smith', 'jones', 'williams', 'brown', 'wilson', 'taylor', 'johnson', 'white', 'martin', 'anderson',
+    'thompson', 'nguyen', 'thomas', 'walker', 'harris', 'lee', 'ryan', 'robinson', 'kelly', 'king',
+    'davis', 'wright', 'evans', 'roberts', 'green', 'hall', 'wood', 'jackson', 'clarke', 'patel',
+    'chen', 'wang', 'li', 'zhang', 'campbell', 'mitchell', 'young', 'hughes', 'edwards', 'hill',
+]
+
+# The stages timed by run_benchmark, in pipeline order.
+# 'export_previous' times the per-cell styled Excel export that create_styled_excel replaced.
+STAGES = ['load', 'normalize', 'standardize', 'match', 'dedupe', 'export', 'export_previous']
+
+
+# Function to introduce one random typo (substitution, deletion, insertion or transposition)
+# into each of the given strings
+def add_typos(values, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    result = []
+    for value in values:
+        position = int(rng.integers(0, max(len(value) - 1, 1)))
+        edit = rng.integers(0, 4)
+        if edit == 0:
+            value = value[:position] + letters[rng.integers(0, 26)] + value[position + 1:]
+        elif edit == 1:
+            value = value[:position] + value[position + 1:]
+        elif edit == 2:
+            value = value[:position] + letters[rng.integers(0, 26)] + value[position:]
+        else:
+            value = value[:position] + value[position + 1:position + 2] + value[position:position + 1] + value[position + 2:]
+        result.append(value)
+    return result
+
+
+# Function to generate an internal (lookup) dataset and a target dataset drawn from it.
+# Every lookup row has a unique mobile number, so a target is matched correctly when its match
+# carries the mobile of the row it was drawn from (returned as the ground truth).
+# typo_rate is the share of target addresses, and separately of owner names, that get a typo.
+def generate_datasets(lookup_rows, target_rows, typo_rate=0.1, seed=0):
+    rng = np.random.default_rng(seed)
+    suburb_count = max(20, lookup_rows // 300)
+    suburbs = np.unique(
+        np.char.add(rng.choice(SUBURB_PARTS, suburb_count * 2), rng.choice(SUBURB_PARTS, suburb_count * 2))
+    )[:suburb_count]
+    suburbs = np.char.title(suburbs.astype(str))
+
+    numbers = rng.integers(1, 400, lookup_rows).astype(str)
+    units = rng.integers(1, 30, lookup_rows).astype(str)
+    has_unit = rng.random(lookup_rows) < 0.15
+    house = np.where(has_unit, np.char.add(np.char.add(units, '/'), numbers), numbers)
+    street = np.char.title(rng.choice(STREET_NAMES, lookup_rows))
+    type_index = rng.integers(0, len(STREET_TYPES), lookup_rows)
+    short_type = np.array([STREET_TYPES[i][0] for i in type_index])
+    long_type = np.array([STREET_TYPES[i][1] for i in type_index])
+    suburb = rng.choice(suburbs, lookup_rows)
+
+    lookup = pd.DataFrame({
+        'Address': pd.Series(house) + ' ' + street + ' ' + short_type + ', ' + suburb,
+        'First Name': np.char.title(rng.choice(FIRST_NAMES, lookup_rows)),
+        'Last Name': np.char.title(rng.choice(LAST_NAMES, lookup_rows)),
+        'Mobile': rng.permutation(lookup_rows) + 412000000,
+    })
+
+    truth = rng.integers(0, lookup_rows, target_rows)
+    addresses = pd.Series(house[truth]) + ' ' + street[truth] + ' ' + long_type[truth]
+    names = lookup['Last Name'].to_numpy()[truth].astype(object)
+    address_typos = rng.random(target_rows) < typo_rate
+    name_typos = rng.random(target_rows) < typo_rate
+    addresses[address_typos] = add_typos(addresses[address_typos], rng)
+    names[name_typos] = add_typos(names[name_typos], rng)
+
+    target = pd.DataFrame({
+        'Address': addresses.str.upper(),
+        'Suburb': suburb[truth],
+        "Owner's Name": names,
+    })
+    return lookup, target, lookup['Mobile'].to_numpy()[truth]
+
+
+# Function to get the current git commit, so results can be compared across commits
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to save DataFrame to an Excel file in-memory, filling each confidence cell one by one.
+# Kept as it was before the streaming export so the benchmark can compare the two.
+def previous_create_styled_excel(df, confidence_col_index):
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Sheet1')
+        worksheet = writer.sheets['Sheet1']
+
+        # Apply styles after writing
+        for row in range(2, worksheet.max_row + 1):  # Start from 2 to skip the header
+            cell = worksheet.cell(row=row, column=confidence_col_index)
+            value = cell.value
+            color = 'FFFFFF'  # Default white
+            if value == 'High':
+                color = '90EE90'  # Light green
+            elif value == 'Medium':
+                color = 'FFD700'  # Gold
+            elif value == 'Low':
+                color = 'FF6347'  # Tomato red
+            cell.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+    output.seek(0)
+    return output
+
+
+# Function to run every pipeline stage on generated data of one scale and report the timings,
+# memory and match accuracy against the ground truth
+def run_benchmark(lookup_rows, target_rows, typo_rate=0.1, seed=0, strategy='full', trace_memory=False,
+                  profiler=None):
+    lookup, target, truth = generate_datasets(lookup_rows, target_rows, typo_rate, seed)
+    timer = StageTimer(trace_memory, profiler=profiler, profile_stages=('match',))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        lookup_path = os.path.join(data_dir, 'internal.csv')
+        target_path = os.path.join(data_dir, 'target.csv')
+        lookup.to_csv(lookup_path, index=False)
+        target.to_csv(target_path, index=False)
+        lookup, target = timer.run('load', lookup_rows + target_rows,
+                                   lambda: (read_dataset(lookup_path), read_dataset(target_path)))
+
+    lookup, target = timer.run('normalize', lookup_rows + target_rows, lambda: (
+        prepare_lookup_dataset(lookup, standardize=False), prepare_target_dataset(target, standardize=False)
+    ))
+
+    # A fresh standardizer, so its cache starts cold
+    standardizer = AddressStandardizer()
+
+    def standardize():
+        lookup['Address'] = standardizer.standardize_series(lookup['Address'])
+        target['Address'] = standardizer.standardize_series(target['Address'])
+    timer.run('standardize', lookup_rows + target_rows, standardize)
+
+    matches = timer.run('match', target_rows, find_best_matches, target, lookup, strategy=strategy)
+    correct = matches['Mobile'].to_numpy() == truth
+
+    results = timer.run('dedupe', target_rows, finalize_matches, target, matches)
+    kept = results['Confidence'] != 'No Match'
+    high = (results['Confidence'] == 'High').to_numpy()
+    results_correct = (results['Mobile'] == pd.Series(truth).reindex(results.index)).to_numpy()
+
+    confidence_col_index = results.columns.get_loc('Confidence') + 1
+    timer.run('export', target_rows, create_styled_excel, results, confidence_col_index)
+    timer.run('export_previous', target_rows, previous_create_styled_excel, results, confidence_col_index)
+
+    return {
+        'lookup_rows': lookup_rows,
+        'target_rows': target_rows,
+        'typo_rate': typo_rate,
+        'seed': seed,
+        'strategy': strategy,
+        'stages': timer.stages,
+        'profiles': timer.profiles,
+        'total_seconds': sum(stage['seconds'] for stage in timer.stages.values()),
+        'accuracy': {
+            # Share of targets whose best match is the row they were drawn from
+            'match': float(correct.mean()) if target_rows else None,
+            # The same after duplicate suppression, and among the High confidence results
+            'after_dedupe': float(results_correct.mean()) if target_rows else None,
+            'kept_after_dedupe': float(kept.mean()) if target_rows else None,
+            'high_confidence_precision': float(results_correct[high].mean()) if high.any() else None,
+        },
+    }
+
+
+# Function to print how each stage's time changed relative to a previous results file
+def compare_results(previous, current):
+    previous_runs = {(run['lookup_rows'], run['target_rows'], run['strategy']): run for run in previous['runs']}
+    for run in current['runs']:
+        before = previous_runs.get((run['lookup_rows'], run['target_rows'], run['strategy']))
+        if before is None:
+            continue
+        print(f"{run['target_rows']:,} targets x {run['lookup_rows']:,} lookup rows ({run['strategy']}) "
+              f"vs {previous.get('commit')}:")
+        for stage in STAGES:
+            # Results files written before a stage was added have no timing for it
+            if stage not in before['stages']:
+                continue
+            old, new = before['stages'][stage]['seconds'], run['stages'][stage]['seconds']
+            print(f"  {stage:<16} {old:9.3f}s -> {new:9.3f}s  ({new / old if old else float('inf'):.2f}x)")
+        print(f"  {'accuracy':<16} {before['accuracy']['match']:.4f} -> {run['accuracy']['match']:.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MatchPoint matching pipeline on synthetic data.")
+    parser.add_argument('--lookup-rows', type=int, nargs='+', default=[1000, 10000],
+                        help="internal dataset sizes to run (one run per size)")
+    parser.add_argument('--target-ratio', type=float, default=0.1,
+                        help="target rows as a share of the lookup rows")
+    parser.add_argument('--typo-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategy', choices=list(MATCHING_STRATEGIES), default='full')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="also record the peak Python allocations per stage (slows the run down)")
+    parser.add_argument('--profile', choices=PROFILERS, help="profile the match stage with this profiler")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="a previous results JSON file to compare the stage timings with")
+    args = parser.parse_args(argv)
+
+    results = {
+        'commit': current_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'runs': [],
+    }
+    for lookup_rows in args.lookup_rows:
+        target_rows = max(1, int(lookup_rows * args.target_ratio))
+        run = run_benchmark(lookup_rows, target_rows, args.typo_rate, args.seed, args.strategy, args.trace_memory,
+                            args.profile)
+        results['runs'].append(run)
+        stages = ', '.join(f"{stage} {run['stages'][stage]['seconds']:.2f}s" for stage in STAGES)
+        print(f"{target_rows:,} x {lookup_rows:,}: {stages}; accuracy {run['accuracy']['match']:.4f}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as handle:
+            compare_results(json.load(handle), results)
+
+
+if __name__ == '__main__':
+    main()
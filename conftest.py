@@ -0,0 +1 @@
+# Makes the top-level modules (Functions, pipeline) importable from the tests
@@ -1,230 +1,207 @@
-import streamlit as st
-import pandas as pd
-from Functions import *
-
-
-
-def dashboard_1():
-    st.image("logo.png", width=400)
-
-    st.title("MatchPoint: Ultimate Address Intelligence")
-
-    # Start a form block
-    st.sidebar.title("Upload Files")
-    with st.sidebar.form(key='file_upload_form'):
-        # Create file uploaders
-        uploaded_file_1 = st.file_uploader("Upload Internal Dataset", type=['xlsx', 'csv'])
-        uploaded_file_2 = st.file_uploader("Upload Target Dataset", type=['xlsx', 'csv'])
-
-        # Create a submit button
-        submit_button = st.form_submit_button(label='Submit')
-
-    # Use the uploaded files
-    if submit_button:
-        if uploaded_file_1 is not None and uploaded_file_2 is not None:
-            # read uploaded_file_1 first and check if xlsx or csv
-            if uploaded_file_1.name.endswith('.xlsx'):
-                dataset_1 = pd.read_excel(uploaded_file_1)
-            elif uploaded_file_1.name.endswith('.csv'):
-                dataset_1 = pd.read_csv(uploaded_file_1)
-            else:
-                st.error("Invalid file format. Please upload an Excel file.")
-
-            # read uploaded_file_2 and check if xlsx or csv
-            if uploaded_file_2.name.endswith('.xlsx'):
-                dataset_2 = pd.read_excel(uploaded_file_2)
-            elif uploaded_file_2.name.endswith('.csv'):
-                dataset_2 = pd.read_csv(uploaded_file_2)
-            else:
-                st.error("Invalid file format. Please upload an Excel file.")
-
-
-                # Clean up the column names for both datasets
-            dataset_1 = clean_column_names(dataset_1)
-            dataset_2 = clean_column_names(dataset_2)
-
-
-            #make sure everything is lowered case
-            dataset_1['Address'] = dataset_1['Address'].str.lower()
-            dataset_2['Address'] = dataset_2['Address'].str.lower()
-
-            # Merge 'Address' and 'Suburb' in Dataset 2 for full address comparison
-            dataset_2['Address'] = dataset_2['Address'].str.cat(dataset_2['Suburb'], sep=', ')
-
-            # Normalize addresses by converting to lowercase and removing commas and spaces for consistent matching
-            dataset_1['Address'] = dataset_1['Address'].str.lower().str.replace(',', '').str.strip()
-            dataset_2['Address'] = dataset_2['Address'].str.lower().str.replace(',', '').str.strip()
-
-            # Prepare names by combining 'First Name' and 'Last Name' in Dataset 1 and normalizing
-            dataset_1['Full Name'] = dataset_1.apply(lambda row: f"{row['First Name']} {row['Last Name']}".strip().lower(), axis=1)
-
-            # Ensure the 'Owner's Name' in Dataset 2 is also normalized for comparison
-            dataset_2["Owner's Name"] = dataset_2["Owner's Name"].str.lower().str.strip()
-
-            # Standardize addresses
-            dataset_1['Address'] = dataset_1['Address'].apply(standardize_address)
-            dataset_2['Address'] = dataset_2['Address'].apply(standardize_address)
-            matches_df = find_best_matches(dataset_2, dataset_1)
-
-
-
-        # Example of applying the updated function to all rows in dataset_2 and updating the mobile column
-            #results = dataset_2.apply(lambda x: combined_matching(x['Address'], x["Owner's Name"], dataset_1), axis=1)
-            #address_scores, name_scores = precompute_scores(dataset_1)
-
-
-
-            # Assuming dataset_2 already has a 'Mobile' column you want to update
-            dataset_2[['Best Match Address', 'Best Match Name', 'Combined Score', 'Mobile']] = matches_df[['Best Match Address', 'Best Match Name', 'Combined Score', 'Mobile']]
-            #dataset_2['Combined Score'] = dataset_2['Address Score'] * dataset_2['Name Score']
-
-            dataset_2['Combined Score'] = normalize_combined_score(dataset_2['Combined Score'])
-            dataset_2['Confidence'] = dataset_2['Combined Score'].apply(confidence)
-            #dataset_2 = dataset_2.drop(['Address Score', 'Name Score'], axis=1)
-
-
-
-            # Sort the DataFrame by 'Combined Score' in descending order
-            df_sorted = dataset_2.sort_values(by='Combined Score', ascending=False)
-
-            # Create a mask to identify duplicates, excluding the first occurrence
-            is_duplicate = df_sorted.duplicated(subset=['Best Match Address'], keep='first')
-
-            # For the identified duplicates, replace all other columns with NaN
-            df_sorted.loc[is_duplicate, ['Best Match Address', 'Mobile', 'Best Match Name']] = np.nan
-            df_sorted.loc[is_duplicate, ['Combined Score']] = 0
-            df_sorted.loc[is_duplicate, ['Confidence']] = 'No Match'
-
-
-            st.write(df_sorted)
-
-            st.write('Number of addresses with high confidence:', df_sorted[df_sorted['Confidence'] == 'High'].shape[0])
-            st.write('Number of addresses with medium confidence:', df_sorted[df_sorted['Confidence'] == 'Medium'].shape[0])
-            st.write('Number of addresses with low confidence:', df_sorted[df_sorted['Confidence'] == 'Low'].shape[0])
-
-
-            # Determine the index of the 'Confidence' column (+1 because Excel columns are 1-indexed)
-            confidence_col_index = df_sorted.columns.get_loc('Confidence') + 1
-
-            # Create the styled Excel file
-            excel_data = create_styled_excel(df_sorted, confidence_col_index)
-
-            # Provide the download button in Streamlit
-            st.download_button(
-                label="Download Excel file",
-                data=excel_data.read(),  # Use `.read()` to get the bytes
-                file_name="styled_dataframe.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-
-def dashboard_2():
-    st.image("logo.png", width=400)
-    st.title("MatchPoint: Mobile Matching")
-
-
-    # Start a form block
-    st.sidebar.title("Upload Files")
-    with st.sidebar.form(key='file_upload_form'):
-        # Create file uploaders
-        contact_list = st.file_uploader("Buyer List File", type=['xlsx', 'csv'])
-        internal_df = st.file_uploader("Upload Internal Dataset", type=['xlsx', 'csv'])
-
-        # Create a submit button
-        submit_button = st.form_submit_button(label='Submit')
-
-    # Use the uploaded files
-    if submit_button:
-        if contact_list is not None and internal_df is not None:
-            # read uploaded_file_1 first and check if xlsx or csv
-            if contact_list.name.endswith('.xlsx'):
-                contact_list = pd.read_excel(contact_list,skiprows=1)
-            elif contact_list.name.endswith('.csv'):
-                contact_list = pd.read_csv(contact_list,skiprows=1)
-            else:
-                st.error("Invalid file format. Please upload an Excel file.")
-
-
-            if internal_df.name.endswith('.xlsx'):
-                internal_df = pd.read_excel(internal_df)
-            elif internal_df.name.endswith('.csv'):
-                internal_df = pd.read_csv(internal_df)
-            else:
-                st.error("Invalid file format. Please upload an Excel file.")
-
-
-
-
-            contact_list['Name'] = contact_list['Name'].ffill()
-            # First, preparing data for aggregation by ensuring non-null values are carried forward within each group
-            contact_list['Mobile'] = contact_list['Contact'].apply(lambda x: x.replace('[M]:', '').strip() if '[M]:' in x else None)
-            contact_list['Email'] = contact_list['Contact'].apply(lambda x: x.replace('[E]:', '').strip() if '[E]:' in x else None)
-            contact_list['Should I contact?'] = contact_list['Contact'].apply(lambda x: x if x == 'Do Not Email'  else None)
-
-            # Using groupby on 'Name' and aggregating Mobile and Email, ensuring we capture all unique values (though this example takes the first non-null)
-            grouped_by_name = contact_list.groupby('Name').agg({
-                'Address': 'first',  # Assuming the first address is the primary one for simplicity
-                'Mobile': 'first',   # Taking the first non-null Mobile number
-                'Email': 'first',     # Taking the first non-null Email address
-                'Should I contact?':'first'
-            }).reset_index()
-
-            # Display the grouped dataset
-
-            grouped_by_name.fillna({'Should I contact?':'Yes', 'Mobile':9999999999}, inplace=True)
-
-
-            # Reapply standardization with the updated function
-            grouped_by_name['Mobile'] = grouped_by_name['Mobile'].apply(standardize_mobile_v2).astype(str)
-            internal_df['Mobile'] = internal_df['Mobile'].apply(standardize_mobile_v2).astype(str)
-
-            # Mapping addresses from internal_db to grouped_by_name based on matching mobile numbers
-            address_map = internal_df.set_index('Mobile')['Address'].to_dict()
-            grouped_by_name['Address'] = grouped_by_name['Mobile'].map(address_map).fillna(grouped_by_name['Address'])
-
-
-            # Adding a column to indicate if a match was found for the address update
-            grouped_by_name['Found a Match'] = grouped_by_name['Mobile'].map(address_map).notna()
-
-
-
-            st.write(grouped_by_name)
-
-
-            output = BytesIO()
-            # Write the DataFrame to an Excel writer
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                grouped_by_name.to_excel(writer, index=False, sheet_name='Sheet1')
-
-                workbook = writer.book
-                worksheet = writer.sheets['Sheet1']
-            output.seek(0)
-
-            # Provide the download button in Streamlit
-            st.download_button(
-                label="Download Excel file",
-                data=output.read(),  # Use `.read()` to get the bytes
-                file_name="buyer_list_dataframe.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-page_names_to_funcs = {
-    "MatchPoint: Ultimate Address Intelligence": dashboard_1,
-    "MatchPoint: Mobile Matching": dashboard_2
-}
-
-dashboard_name = st.sidebar.selectbox("Choose a dashboard", page_names_to_funcs.keys())
-page_names_to_funcs[dashboard_name]()
+import streamlit as st
+import pandas as pd
+from Functions import *
+from pipeline import MatchingJobs, run_mobile_matching
+
+
+RESULT_MIME_TYPES = {
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'csv': "text/csv",
+    'parquet': "application/vnd.apache.parquet",
+}
+
+
+def dashboard_1():
+    st.image("logo.png", width=400)
+
+    st.title("MatchPoint: Ultimate Address Intelligence")
+
+    # Start a form block
+    st.sidebar.title("Upload Files")
+    with st.sidebar.form(key='file_upload_form'):
+        # Create file uploaders
+        uploaded_file_1 = st.file_uploader("Upload Internal Dataset", type=['xlsx', 'csv'])
+        uploaded_file_2 = st.file_uploader("Upload Target Dataset", type=['xlsx', 'csv'])
+
+        # Large targets are matched and exported chunk by chunk to keep memory bounded
+        streaming = st.checkbox("Large file mode (process the target dataset in chunks)")
+        output_format = st.selectbox("Output format", RESULT_FORMATS)
+        strategy = st.selectbox("Matching strategy", list(MATCHING_STRATEGIES))
+        processes = st.number_input("Worker processes", min_value=1, max_value=os.cpu_count() or 1,
+                                    value=os.cpu_count() or 1)
+        # Targets that lose their best address to another target can fall back to an alternative
+        one_to_one = st.checkbox("One-to-one assignment (use with the top_k strategy)")
+        # Token and phonetic scorers also match names written in another order, case or spelling
+        name_scorer = st.selectbox("Name scorer", list(NAME_SCORERS))
+        profiler = st.selectbox("Profile the matching stage", [None] + PROFILERS,
+                                format_func=lambda name: name or "No profiling")
+
+        # Create a submit button
+        submit_button = st.form_submit_button(label='Submit')
+
+    # Queue the match as a background job, so the page stays responsive and several runs can be queued
+    if submit_button:
+        if uploaded_file_1 is not None and uploaded_file_2 is not None:
+            job_id = matching_jobs().submit(uploaded_file_1, uploaded_file_2, profiler=profiler,
+                                            output_format=output_format, strategy=strategy, processes=processes,
+                                            streaming=streaming, one_to_one=one_to_one, name_scorer=name_scorer)
+            job_ids = st.session_state.setdefault('job_ids', [])
+            if job_id not in job_ids:
+                job_ids.insert(0, job_id)
+
+    show_jobs()
+
+
+# Function to get the job queue shared by every session, so a job survives reruns and results
+# are reused when the same files are submitted again
+@st.cache_resource
+def matching_jobs():
+    return MatchingJobs()
+
+
+# Function to load the results of a finished job once per job rather than on every rerun
+@st.cache_data(max_entries=8)
+def job_result(job_id):
+    results, output_path, record = matching_jobs().result(job_id)
+    with open(output_path, 'rb') as output:
+        return results, output.read(), record
+
+
+# List the jobs of this session; while any job is still queued or running the list polls for progress
+def show_jobs():
+    job_ids = st.session_state.get('job_ids', [])
+    pending = jobs_pending(job_ids)
+
+    @st.fragment(run_every=1.0 if pending else None)
+    def job_list():
+        for job_id in job_ids:
+            job = matching_jobs().status(job_id)
+            if job is None:
+                continue
+            st.subheader(job['name'])
+            if job['status'] == 'queued':
+                st.info("Waiting for an earlier job to finish...")
+            elif job['status'] == 'running':
+                stage, rows_done, total_rows = job['progress'] or ('matching', 0, None)
+                # Large file mode does not know the number of rows up front
+                total = f" of {total_rows:,}" if total_rows else ""
+                st.progress(rows_done / total_rows if total_rows else 0.0,
+                            text=f"{stage.capitalize()}: {rows_done:,}{total} rows")
+            elif job['status'] == 'failed':
+                st.error(job['error'])
+            else:
+                show_job_results(job)
+        # Rerun the whole page once everything has finished, which stops the polling
+        if pending and not jobs_pending(job_ids):
+            st.rerun()
+
+    job_list()
+
+
+# Function to check whether any of the given jobs is still queued or running
+def jobs_pending(job_ids):
+    jobs = [job for job in map(matching_jobs().status, job_ids) if job is not None]
+    return any(job['status'] in ('queued', 'running') for job in jobs)
+
+
+# Show the results of a finished job: the matches, the confidence counts and the output file
+def show_job_results(job):
+    df_sorted, output_data, record = job_result(job['id'])
+    output_format = job['parameters']['output_format']
+
+    if df_sorted is None:
+        # Large file mode writes the matches straight to the output file
+        st.write(f"Matched {record['stages']['matching']['rows']:,} rows")
+    else:
+        st.write(df_sorted)
+
+        st.write('Number of addresses with high confidence:', df_sorted[df_sorted['Confidence'] == 'High'].shape[0])
+        st.write('Number of addresses with medium confidence:', df_sorted[df_sorted['Confidence'] == 'Medium'].shape[0])
+        st.write('Number of addresses with low confidence:', df_sorted[df_sorted['Confidence'] == 'Low'].shape[0])
+        if 'assignment' in df_sorted.attrs:
+            st.write('Matches recovered by one-to-one assignment:', df_sorted.attrs['assignment']['recovered'])
+
+    st.download_button(
+        label=f"Download {output_format.upper()} file",
+        data=output_data,
+        file_name=f"styled_dataframe.{output_format}" if df_sorted is not None else f"matched_dataframe.{output_format}",
+        mime=RESULT_MIME_TYPES[output_format],
+        key=f"download-{job['id']}"
+    )
+    show_run_statistics(record, key=job['id'])
+
+
+# Show where the time of a run went: the stage breakdown, the fuzzy comparisons, any profiler
+# report, and the run record as JSON for capacity planning
+def show_run_statistics(record, key=None):
+    with st.expander("Run statistics"):
+        st.dataframe(pd.DataFrame.from_dict(record['stages'], orient='index'))
+        st.write('Total time (seconds):', round(record['total_seconds'], 2))
+        st.write('Fuzzy comparisons:', f"{record['fuzzy_comparisons']:,}")
+        for stage, report in record['profiles'].items():
+            st.text(f"Profile of the {stage} stage")
+            st.code(report)
+        st.download_button(label="Download run record (JSON)", data=json.dumps(record, indent=2),
+                           file_name="run_statistics.json", mime="application/json",
+                           key=f"record-{key}")
+
+
+def dashboard_2():
+    st.image("logo.png", width=400)
+    st.title("MatchPoint: Mobile Matching")
+
+
+    # Start a form block
+    st.sidebar.title("Upload Files")
+    with st.sidebar.form(key='file_upload_form'):
+        # Create file uploaders
+        contact_list = st.file_uploader("Buyer List File", type=['xlsx', 'csv'])
+        internal_df = st.file_uploader("Upload Internal Dataset", type=['xlsx', 'csv'])
+
+        # Create a submit button
+        submit_button = st.form_submit_button(label='Submit')
+
+    # Use the uploaded files
+    if submit_button:
+        if contact_list is not None and internal_df is not None:
+            timer = StageTimer()
+            output = BytesIO()
+            try:
+                # One row per buyer, with the address filled in wherever the mobile is in the internal
+                # dataset, exported to the Excel file offered below
+                grouped_by_name = run_mobile_matching(contact_list, internal_df, output=output, timer=timer)
+            except ValueError as error:
+                st.error(str(error))
+                return
+
+            st.write(grouped_by_name)
+
+            # Provide the download button in Streamlit
+            st.download_button(
+                label="Download Excel file",
+                data=output.getvalue(),
+                file_name="buyer_list_dataframe.xlsx",
+                mime=RESULT_MIME_TYPES['xlsx']
+            )
+            show_run_statistics(timer.record())
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+page_names_to_funcs = {
+    "MatchPoint: Ultimate Address Intelligence": dashboard_1,
+    "MatchPoint: Mobile Matching": dashboard_2
+}
+
+dashboard_name = st.sidebar.selectbox("Choose a dashboard", page_names_to_funcs.keys())
+page_names_to_funcs[dashboard_name]()
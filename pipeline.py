@@ -0,0 +1,338 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+
+from Functions import (
+    LOOKUP_CACHE_DIR, MATCHING_STRATEGIES, NAME_SCORERS, PROFILERS, RESULT_FORMATS, STREAM_CHUNK_SIZE,
+    AddressIndex, LookupCache, MatchStore, StageTimer, TfidfIndex,
+    address_standardizer, export_results, finalize_matches, find_best_matches_incremental, find_best_matches_parallel,
+    load_blocking_index, load_lookup_dataset, load_mobile_index, match_buyer_addresses, match_in_chunks,
+    parse_contact_list, prepare_target_dataset, read_dataset,
+)
+
+
+# Function to run the address matching (dashboard_1) on an internal dataset and a target dataset,
+# given as file paths or uploaded files.
+# Without streaming the finished, sorted results are returned (and exported to output if given).
+# With streaming the targets are matched and written to output chunk_size rows at a time and the
+# number of rows written is returned.
+# With a store directory the matches of the previous run kept there are reused, and only the targets
+# and lookup rows that changed since are scored (full strategy only, without streaming).
+# With one_to_one the matched addresses are shared out by an optimal assignment over all candidates
+# (use the top_k strategy to have alternatives) instead of only keeping the best target per address.
+# name_scorer selects how owner's names are scored (see NAME_SCORERS).
+# progress(stage, rows_done, total_rows) is called as the work advances; total_rows is None
+# when it is not known up front. Each stage is recorded in timer (a StageTimer) when one is given.
+def run_address_matching(internal_file, target_file, output=None, output_format='xlsx', strategy='full',
+                         processes=1, chunk_size=STREAM_CHUNK_SIZE, streaming=False, progress=None, cache=None,
+                         store=None, one_to_one=False, name_scorer='ratio', timer=None):
+    if store is not None and (streaming or strategy != 'full'):
+        raise ValueError("Incremental matching works with the full strategy and without streaming")
+    if one_to_one and streaming:
+        raise ValueError("One-to-one assignment works without streaming only")
+    # Refuses a store directory that holds other files before any work is done
+    match_store = MatchStore(store) if store is not None else None
+    cache = cache or LookupCache()
+    progress = progress or (lambda stage, rows_done, total_rows: None)
+    timer = timer or StageTimer()
+
+    # The internal dataset is normalized once and then served from the on-disk cache
+    with timer.stage('load internal') as stage:
+        lookup_dataset, cache_key = load_lookup_dataset(internal_file, cache)
+        stage['rows'] = len(lookup_dataset)
+    match_options = {'strategy': strategy, 'name_scorer': name_scorer}
+    if strategy == 'blocked':
+        match_options['blocking_index'] = timer.run(
+            'blocking index', len(lookup_dataset), load_blocking_index, lookup_dataset, cache_key, cache
+        )
+    if strategy == 'exact_first':
+        match_options['address_index'] = timer.run(
+            'address index', len(lookup_dataset), AddressIndex, lookup_dataset['Address']
+        )
+    if strategy == 'tfidf':
+        # Built once here, otherwise every streamed chunk would build its own
+        match_options['tfidf_index'] = timer.run(
+            'tfidf index', len(lookup_dataset), TfidfIndex, lookup_dataset['Address']
+        )
+
+    if streaming:
+        if output is None:
+            raise ValueError("Streaming mode needs an output file")
+        # In streaming mode reading, matching and writing the chunks are one stage
+        with timer.stage('matching') as matching:
+            matching['rows'] = match_in_chunks(
+                target_file, lookup_dataset, output, output_format, chunk_size=chunk_size, processes=processes,
+                cache=cache, cache_key=cache_key, progress=lambda stage, rows_done: progress(stage, rows_done, None), **match_options
+            )
+        return matching['rows']
+
+    with timer.stage('read target') as stage:
+        target_dataset = read_dataset(target_file)
+        stage['rows'] = len(target_dataset)
+    target_dataset = timer.run('normalize target', len(target_dataset), prepare_target_dataset, target_dataset,
+                               standardize=False)
+    with timer.stage('standardize target', len(target_dataset)):
+        target_dataset['Address'] = address_standardizer.standardize_series(target_dataset['Address'])
+
+    with timer.stage('matching', len(target_dataset)):
+        if match_store is not None:
+            matches = find_best_matches_incremental(target_dataset, lookup_dataset, match_store,
+                                                    name_scorer=name_scorer)
+            progress('matching', len(matches), len(matches))
+        else:
+            matches = find_best_matches_parallel(
+                target_dataset, lookup_dataset, processes=processes, cache=cache, cache_key=cache_key,
+                progress=lambda rows_done, total_rows: progress('matching', rows_done, total_rows), **match_options
+            )
+    results = timer.run('finalize', len(matches), finalize_matches, target_dataset, matches, one_to_one=one_to_one)
+    if output is not None:
+        timer.run('export', len(results), export_results, results, output, output_format)
+        progress('writing', len(results), len(results))
+    return results
+
+
+# Function to run the mobile matching (dashboard_2): one row per buyer from the buyer list, with the
+# address filled in from the internal dataset wherever the buyer's mobile is found there
+def run_mobile_matching(buyer_file, internal_file, output=None, output_format='xlsx', cache=None, timer=None):
+    timer = timer or StageTimer()
+    with timer.stage('read buyers') as stage:
+        contact_list = read_dataset(buyer_file, skiprows=1)
+        stage['rows'] = len(contact_list)
+    # The mobile -> address index of the internal dataset is built once and then cached
+    mobile_index = timer.run('mobile index', None, load_mobile_index, internal_file, cache or LookupCache())
+
+    buyers = timer.run('matching', len(contact_list), lambda: match_buyer_addresses(
+        parse_contact_list(contact_list), mobile_index
+    ))
+    if output is not None:
+        timer.run('export', len(buyers), export_results, buyers, output, output_format, confidence_column=None)
+    return buyers
+
+
+# Where the results of finished matching jobs are kept, one directory per job key
+JOB_RESULTS_DIR = os.path.join(LOOKUP_CACHE_DIR, 'results')
+# The least recently used job results are removed once they take more than this
+JOB_RESULTS_MAX_BYTES = 2 * 1024 ** 3
+# Part of every job key: bump it whenever matching changes, so results of older code are not reused
+JOB_RESULTS_VERSION = 1
+# Matching jobs run at the same time; further jobs wait in the queue
+JOB_WORKERS = 1
+
+
+# Function to read an uploaded file or a file path into bytes plus its file name
+def _file_data(file):
+    if hasattr(file, 'getvalue'):
+        return file.getvalue(), os.path.basename(getattr(file, 'name', 'upload'))
+    with open(file, 'rb') as handle:
+        return handle.read(), os.path.basename(str(file))
+
+
+# Function to get the key of an address matching job: the same input files (by content) and the
+# same parameters always give the same key, so finished results can be reused
+def job_key(internal_data, target_data, parameters):
+    digest = hashlib.sha256(f'v{JOB_RESULTS_VERSION}:'.encode())
+    for data in (internal_data, target_data):
+        digest.update(hashlib.sha256(data).digest())
+    digest.update(json.dumps(parameters, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+# Runs address matching jobs in background threads so the Streamlit session is not blocked, and
+# keeps each finished job's results on disk under its job_key. Submitting the same files with the
+# same parameters again returns the running or finished job instead of matching again.
+# The least recently used results are evicted once they take more than max_bytes on disk.
+# Every job is a dict with its 'id', 'name', 'parameters', 'status' (queued, running, done or
+# failed), 'progress' (stage, rows_done, total_rows) and 'error'.
+class MatchingJobs:
+    def __init__(self, results_dir=JOB_RESULTS_DIR, workers=JOB_WORKERS, cache=None,
+                 max_bytes=JOB_RESULTS_MAX_BYTES):
+        self.results_dir = results_dir
+        self.max_bytes = max_bytes
+        self.cache = cache or LookupCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='matching-job')
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def _entry(self, job_id):
+        return os.path.join(self.results_dir, job_id)
+
+    def _record(self, job_id):
+        return os.path.join(self._entry(job_id), 'record.json')
+
+    # Function to queue address matching of target_file against internal_file with the given
+    # run_address_matching parameters (output_format, strategy, processes, streaming, one_to_one,
+    # name_scorer) plus an optional profiler; returns the job id
+    def submit(self, internal_file, target_file, profiler=None, **parameters):
+        internal_data, internal_name = _file_data(internal_file)
+        target_data, target_name = _file_data(target_file)
+        parameters = {'output_format': 'xlsx', **parameters}
+        job_id = job_key(internal_data, target_data, {**parameters, 'profiler': profiler})
+
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job['status'] in ('queued', 'running'):
+                return job_id
+            job = {
+                'id': job_id, 'name': f"{target_name} against {internal_name}", 'parameters': parameters,
+                'status': 'queued', 'progress': None, 'error': None, 'submitted': time.time(),
+            }
+            self.jobs[job_id] = job
+            if os.path.isfile(self._record(job_id)):
+                # Reused results count as recently used for eviction
+                os.utime(self._record(job_id))
+                job['status'] = 'done'
+                return job_id
+
+        internal_file, target_file = BytesIO(internal_data), BytesIO(target_data)
+        internal_file.name, target_file.name = internal_name, target_name
+        self.executor.submit(self._run, job, internal_file, target_file, profiler)
+        return job_id
+
+    def _run(self, job, internal_file, target_file, profiler):
+        job['status'] = 'running'
+        os.makedirs(self.results_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.results_dir, prefix='.staging-')
+        try:
+            timer = StageTimer(profiler=profiler)
+            output = os.path.join(staging, f"results.{job['parameters']['output_format']}")
+            results = run_address_matching(
+                internal_file, target_file, output, cache=self.cache, timer=timer,
+                progress=lambda stage, rows_done, total_rows: job.update(progress=(stage, rows_done, total_rows)),
+                **job['parameters'],
+            )
+            if isinstance(results, pd.DataFrame):
+                results.to_pickle(os.path.join(staging, 'results.pkl'))
+            with open(os.path.join(staging, 'record.json'), 'w') as handle:
+                json.dump(timer.record(name=job['name'], parameters=job['parameters'],
+                                       output=os.path.basename(output)), handle)
+
+            shutil.rmtree(self._entry(job['id']), ignore_errors=True)
+            os.replace(staging, self._entry(job['id']))
+            job['status'] = 'done'
+            self.evict(keep=job['id'])
+        except Exception as error:  # a failed job is reported in its status, not lost in the worker thread
+            job['status'] = 'failed'
+            job['error'] = str(error) if isinstance(error, ValueError) else f"{type(error).__name__}: {error}"
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    # Remove the least recently used job results until they fit in max_bytes; the results of the
+    # keep job (the one that just finished) always stay
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.results_dir):
+            if name.startswith('.') or not os.path.isfile(self._record(name)):
+                continue
+            entry = self._entry(name)
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(self._record(name)), size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name != keep:
+                shutil.rmtree(self._entry(name), ignore_errors=True)
+                total -= size
+
+    # Function to get a snapshot of a job (None for an unknown id). A finished job whose results
+    # were evicted since is reported as failed, so it can be submitted again.
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job['status'] == 'done' and not os.path.isfile(self._record(job_id)):
+                job['status'] = 'failed'
+                job['error'] = "The results of this job were removed from the cache, submit it again"
+            return dict(job)
+
+    # Function to get a finished job's results: the results DataFrame (None in streaming mode),
+    # the path of the exported results file, and the run record of its stages
+    def result(self, job_id):
+        entry = self._entry(job_id)
+        os.utime(self._record(job_id))
+        with open(self._record(job_id)) as handle:
+            record = json.load(handle)
+        frame = os.path.join(entry, 'results.pkl')
+        results = pd.read_pickle(frame) if os.path.isfile(frame) else None
+        return results, os.path.join(entry, record['output']), record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run MatchPoint matching jobs without the Streamlit app.")
+    parser.add_argument('--cache-dir', help="where preprocessed internal datasets are cached")
+    parser.add_argument('--stats', help="append the run's stage timings to this file as a JSON line")
+    parser.add_argument('--profile', choices=PROFILERS, help="profile the matching stage and keep the report in --stats")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    address = commands.add_parser('address', help="match target addresses and owners against the internal dataset")
+    address.add_argument('internal', help="internal dataset (.xlsx or .csv)")
+    address.add_argument('target', help="target dataset (.xlsx or .csv)")
+    address.add_argument('output', help="results file")
+    address.add_argument('--format', choices=RESULT_FORMATS, help="output format (default: from the output file extension)")
+    address.add_argument('--strategy', choices=list(MATCHING_STRATEGIES), default='full')
+    address.add_argument('--processes', type=int, default=1, help="worker processes (0 for one per CPU)")
+    address.add_argument('--chunk-size', type=int, default=STREAM_CHUNK_SIZE, help="target rows per chunk when streaming")
+    address.add_argument('--streaming', action='store_true', help="match and write the target file in chunks")
+    address.add_argument('--store', help="directory keeping the matches between runs, to rematch only what changed")
+    address.add_argument('--one-to-one', action='store_true',
+                         help="share out the matched addresses by optimal assignment (best with --strategy top_k)")
+    address.add_argument('--name-scorer', choices=list(NAME_SCORERS), default='ratio',
+                         help="how owner's names are scored against the matched last names")
+
+    mobile = commands.add_parser('mobile', help="fill in buyer addresses by mobile number")
+    mobile.add_argument('buyers', help="buyer list (.xlsx or .csv)")
+    mobile.add_argument('internal', help="internal dataset (.xlsx or .csv)")
+    mobile.add_argument('output', help="results file")
+    mobile.add_argument('--format', choices=RESULT_FORMATS, help="output format (default: from the output file extension)")
+
+    args = parser.parse_args(argv)
+    output_format = args.format or args.output.rsplit('.', 1)[-1]
+    if output_format not in RESULT_FORMATS:
+        parser.error(f"cannot tell the output format from '{args.output}', use --format")
+    cache = LookupCache(args.cache_dir) if args.cache_dir else LookupCache()
+    timer = StageTimer(profiler=args.profile)
+
+    def report(stage, rows_done, total_rows):
+        total = f" of {total_rows:,}" if total_rows else ""
+        print(f"{stage}: {rows_done:,}{total} rows", file=sys.stderr)
+
+    try:
+        if args.command == 'address':
+            rows = run_address_matching(
+                args.internal, args.target, args.output, output_format, strategy=args.strategy,
+                processes=args.processes or None, chunk_size=args.chunk_size, streaming=args.streaming,
+                progress=report, cache=cache, store=args.store, one_to_one=args.one_to_one,
+                name_scorer=args.name_scorer, timer=timer,
+            )
+            if 'assignment' in getattr(rows, 'attrs', {}):
+                print(f"One-to-one assignment recovered {rows.attrs['assignment']['recovered']:,} matches",
+                      file=sys.stderr)
+            rows = rows if args.streaming else len(rows)
+        else:
+            rows = len(run_mobile_matching(args.buyers, args.internal, args.output, output_format, cache=cache,
+                                           timer=timer))
+    except ValueError as error:
+        parser.exit(1, f"error: {error}\n")
+    print(f"Wrote {rows:,} rows to {args.output}", file=sys.stderr)
+    print(', '.join(f"{name} {stage['seconds']:.2f}s" for name, stage in timer.stages.items()), file=sys.stderr)
+
+    if args.stats:
+        parameters = {name: value for name, value in vars(args).items() if name not in ('stats', 'profile')}
+        with open(args.stats, 'a') as handle:
+            handle.write(json.dumps(timer.record(rows=rows, **parameters)) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from Functions import AddressIndex, STREET_TYPES, find_best_matches, parse_address
+
+
+@pytest.mark.parametrize('address', [
+    '3/51 smith street bonfield',
+    '3 / 51 smith street bonfield',
+    'u3/51 smith street bonfield',
+    'unit 3 51 smith street bonfield',
+    'unit 3/51 smith street bonfield',
+])
+def test_unit_forms(address):
+    assert parse_address(address) == ('3', '51', 'smith', 'street', 'bonfield')
+
+
+def test_house_number_range():
+    assert parse_address('12-14 smith street bonfield') == ('', '12-14', 'smith', 'street', 'bonfield')
+    assert parse_address('12 - 14 smith st') == ('', '12-14', 'smith', 'street', '')
+
+
+def test_words_that_are_not_street_types():
+    assert parse_address('7 park w ryde') is None
+    assert parse_address('7 west park road ryde') == ('', '7', 'west park', 'road', 'ryde')
+    for word in ('w', 'up', 'cn', 'cnr', 'blk', 'bch', 'rvr', 'snd', 'twrs', 'vlls', 'trlr', 'west', 'corner'):
+        assert word not in STREET_TYPES
+
+
+def test_no_house_number_or_street_type():
+    assert parse_address('po box 12 bonfield') is None
+    assert parse_address('12 smith bonfield') is None
+
+
+def test_exact_first_refuses_a_different_house_number():
+    lookup = pd.DataFrame({
+        'Address': ['21 smith st bonfield', '12 smith street bonfield'],
+        'Full Name': ['ann jones', 'ben kelly'],
+        'Last Name': ['jones', 'kelly'],
+        'Mobile': [412000001, 412000002],
+    })
+    index = AddressIndex(lookup['Address'])
+    # The same components ('st' is 'street'), but never another house number, unit or street name
+    assert index.exact_matches(pd.Series([
+        '12 smith st bonfield', '21 smith street bonfield', '13 smith street bonfield', 'u2/12 smith street bonfield',
+        '12 smyth street bonfield',
+    ])).tolist() == [1, 0, -1, -1, -1]
+
+    target = pd.DataFrame({'Address': ['12 smith st bonfield'], "Owner's Name": ['kelly']})
+    # The full scan prefers the closer spelling with the other house number
+    assert find_best_matches(target, lookup, strategy='full')['Mobile'].tolist() == [412000001]
+    assert find_best_matches(target, lookup, strategy='exact_first')['Mobile'].tolist() == [412000002]
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+import Functions
+from Functions import ASSIGNMENT_MATCH_BONUS, assign_matches, match_candidate_columns
+
+
+def random_matches(rng):
+    targets = int(rng.integers(1, 9))
+    alternatives = int(rng.integers(0, 4))
+    pool = [f'{number} smith street' for number in range(int(rng.integers(1, 9)))] + ['none']
+    columns = {}
+    for rank in range(alternatives + 1):
+        prefix, score = ('Best Match ', 'Combined Score') if rank == 0 else (f'Alternative {rank} ', f'Alternative {rank} Score')
+        addresses = rng.choice(pool, targets).tolist()
+        columns[prefix + 'Address'] = addresses
+        columns[prefix + 'Name'] = [f'name {rank}'] * targets
+        columns['Mobile' if rank == 0 else prefix + 'Mobile'] = [f'04{rank}{row}' for row in range(targets)]
+        # Rounded so that equal scores are common, and 0 where no name matched
+        columns[score] = np.where(np.array(addresses) == 'none', 0, rng.integers(0, 5, targets) / 4).tolist()
+    return pd.DataFrame(columns)
+
+
+# The best total weight over all one-to-one assignments, from a dense target x address matrix
+def optimal_weight(matches):
+    weights = {}
+    for columns in match_candidate_columns(matches):
+        for row, (address, score) in enumerate(zip(matches[columns[0]], matches[columns[3]])):
+            if address != 'none':
+                weights[row, address] = max(weights.get((row, address), 0), score + ASSIGNMENT_MATCH_BONUS)
+    addresses = sorted({address for _, address in weights})
+    matrix = np.zeros((len(matches), max(len(addresses), 1)))
+    for (row, address), weight in weights.items():
+        matrix[row, addresses.index(address)] = weight
+    rows, columns = linear_sum_assignment(matrix, maximize=True)
+    return matrix[rows, columns].sum()
+
+
+def check_assignment(matches, assigned, unassigned):
+    taken = assigned['Best Match Address'][~unassigned & (assigned['Best Match Address'] != 'none')]
+    assert taken.is_unique
+    for row in taken.index:
+        # Every target takes one of its own candidates, listed only once
+        listed = [assigned.at[row, columns[0]] for columns in match_candidate_columns(assigned)]
+        original = [matches.at[row, columns[0]] for columns in match_candidate_columns(matches)]
+        assert sorted(listed) == sorted(original)
+    return (assigned['Combined Score'][taken.index] + ASSIGNMENT_MATCH_BONUS).sum()
+
+
+def test_assignment_is_optimal():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        matches = random_matches(rng)
+        assigned, unassigned = assign_matches(matches)
+        assert np.isclose(check_assignment(matches, assigned, unassigned), optimal_weight(matches))
+
+
+def test_large_groups_are_assigned_greedily(monkeypatch):
+    monkeypatch.setattr(Functions, 'ASSIGNMENT_MAX_CELLS', 0)
+    rng = np.random.default_rng(1)
+    for _ in range(300):
+        matches = random_matches(rng)
+        assigned, unassigned = assign_matches(matches)
+        check_assignment(matches, assigned, unassigned)
+        # Greedy still leaves no target without an address while one of its candidates is free
+        taken = set(assigned['Best Match Address'][~unassigned])
+        for row in np.flatnonzero(unassigned):
+            candidates = {matches.at[row, columns[0]] for columns in match_candidate_columns(matches)}
+            assert candidates - {'none'} <= taken
+
+    matches = pd.DataFrame({
+        'Best Match Address': ['1 smith street', '1 smith street'], 'Best Match Name': ['a', 'b'],
+        'Mobile': ['0401', '0402'], 'Combined Score': [0.9, 0.8],
+        'Alternative 1 Address': ['2 smith street', 'none'], 'Alternative 1 Name': ['c', 'none'],
+        'Alternative 1 Mobile': ['0403', 'none'], 'Alternative 1 Score': [0.85, 0.0],
+    })
+    # The best remaining score goes first: 0.9 takes '1 smith street', although 0.85 + 0.8 is more
+    assigned, unassigned = assign_matches(matches)
+    assert assigned['Best Match Address'].tolist() == ['1 smith street', '1 smith street']
+    assert unassigned.tolist() == [False, True]
+
+
+def test_assigned_alternative_swaps_with_the_best_match():
+    matches = pd.DataFrame({
+        'Best Match Address': ['1 smith street', '1 smith street'], 'Best Match Name': ['ann', 'ben'],
+        'Mobile': ['0401', '0402'], 'Combined Score': [0.9, 0.95],
+        'Alternative 1 Address': ['2 smith street', 'none'], 'Alternative 1 Name': ['cat', 'none'],
+        'Alternative 1 Mobile': ['0403', 'none'], 'Alternative 1 Score': [0.5, 0.0],
+    })
+    assigned, unassigned = assign_matches(matches)
+    assert not unassigned.any()
+    first = assigned.iloc[0]
+    assert (first['Best Match Address'], first['Best Match Name'], first['Mobile'], first['Combined Score']) == \
+        ('2 smith street', 'cat', '0403', 0.5)
+    assert (first['Alternative 1 Address'], first['Alternative 1 Name'], first['Alternative 1 Mobile'],
+            first['Alternative 1 Score']) == ('1 smith street', 'ann', '0401', 0.9)
+    assert assigned.iloc[1]['Best Match Address'] == '1 smith street'
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Functions import ResultWriter, export_results, pq
+
+
+pytestmark = pytest.mark.skipif(pq is None, reason="parquet export needs pyarrow")
+
+
+def test_parquet_writes_mixed_columns_as_text(tmp_path):
+    results = pd.DataFrame({
+        'Best Match Address': ['1 acacia street bonfield', 'none'],
+        'Combined Score': [0.9, 0.0],
+        'Mobile': pd.Series([412000001, 'none'], dtype=object),
+    })
+    output = str(tmp_path / 'results.parquet')
+    export_results(results, output, 'parquet')
+    written = pq.read_table(output).to_pandas()
+    assert written['Mobile'].tolist() == ['412000001', 'none']
+    assert written['Combined Score'].tolist() == [0.9, 0.0]
+
+
+def test_parquet_schema_fits_later_chunks(tmp_path):
+    output = str(tmp_path / 'results.parquet')
+    with ResultWriter(output, 'parquet') as writer:
+        writer.write(pd.DataFrame({'Notes': [np.nan, np.nan], 'Mobile': [412000001, np.nan],
+                                   'Combined Score': [0.5, 0.7]}))
+        writer.write(pd.DataFrame({'Notes': ['call back', None], 'Mobile': pd.Series([412000003, 'none'], dtype=object),
+                                   'Combined Score': [0.1, 0.0]}))
+    written = pq.read_table(output).to_pandas()
+    assert written['Notes'].tolist()[2] == 'call back'
+    mobiles = written['Mobile'].tolist()
+    assert mobiles[0] == '412000001.0' and pd.isna(mobiles[1]) and mobiles[2:] == ['412000003', 'none']
+    assert len(written) == 4
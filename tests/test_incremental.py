@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Functions import MatchStore, find_best_matches, find_best_matches_incremental
+
+
+STREETS = ['acacia', 'banksia', 'church', 'george', 'koala', 'lachlan', 'oxley', 'wattle']
+TYPES = ['street', 'road', 'avenue', 'close']
+SUBURBS = ['bonfield', 'blackbon', 'epnew', 'daleglen']
+NAMES = ['smith', 'jones', 'kelly', 'roberts', 'patel', 'young']
+
+
+def make_lookup(rng, rows):
+    return pd.DataFrame({
+        'Address': [f"{rng.integers(1, 60)} {rng.choice(STREETS)} {rng.choice(TYPES)} {rng.choice(SUBURBS)}"
+                    for _ in range(rows)],
+        'Last Name': rng.choice(NAMES, rows).tolist(),
+        'Full Name': rng.choice(NAMES, rows).tolist(),
+        'Mobile': rng.integers(400000000, 499999999, rows).tolist(),
+    })
+
+
+def make_target(rng, lookup, rows):
+    addresses = lookup['Address'].sample(rows, replace=True, random_state=int(rng.integers(1 << 30)))
+    # Some typos so that not every target has an exact match
+    addresses = [address[:-1] if rng.random() < 0.3 else address for address in addresses]
+    return pd.DataFrame({'Address': addresses, "Owner's Name": rng.choice(NAMES, rows).tolist()})
+
+
+def assert_same_as_full_scan(target, lookup, store, name_scorer='ratio'):
+    incremental = find_best_matches_incremental(target, lookup, store, name_scorer=name_scorer)
+    full = find_best_matches(target, lookup, strategy='full', name_scorer=name_scorer)
+    pd.testing.assert_frame_equal(incremental, full)
+    return incremental
+
+
+def test_reused_store_matches_full_scan(tmp_path):
+    rng = np.random.default_rng(0)
+    store = MatchStore(str(tmp_path / 'store'))
+    lookup = make_lookup(rng, 300)
+    target = make_target(rng, lookup, 200)
+    assert_same_as_full_scan(target, lookup, store)
+
+    for _ in range(4):
+        # Drop, change and insert lookup rows, and change some targets
+        lookup = lookup.drop(lookup.sample(20, random_state=int(rng.integers(1 << 30))).index)
+        lookup.loc[lookup.sample(10, random_state=int(rng.integers(1 << 30))).index, 'Last Name'] = 'nguyen'
+        lookup = pd.concat([lookup, make_lookup(rng, 30)], ignore_index=True)
+        target = pd.concat([target.iloc[20:], make_target(rng, lookup, 20)], ignore_index=True)
+        results = assert_same_as_full_scan(target, lookup, store)
+        assert results.attrs['incremental']['rescored'] < len(target)
+
+    assert_same_as_full_scan(target, lookup, store, name_scorer='token_sort')
+
+
+def test_store_from_empty_target_is_reused(tmp_path):
+    rng = np.random.default_rng(1)
+    store = MatchStore(str(tmp_path / 'store'))
+    lookup = make_lookup(rng, 100)
+    empty = pd.DataFrame({'Address': pd.Series([], dtype=object), "Owner's Name": pd.Series([], dtype=object)})
+    find_best_matches_incremental(empty, lookup, store)
+    assert_same_as_full_scan(make_target(rng, lookup, 50), lookup, store)
+
+
+def test_store_refuses_other_directories(tmp_path):
+    (tmp_path / 'precious.txt').write_text('keep me')
+    with pytest.raises(ValueError):
+        MatchStore(str(tmp_path))
+    assert (tmp_path / 'precious.txt').exists()
@@ -0,0 +1,41 @@
+import os
+import time
+
+import pandas as pd
+
+from Functions import LookupCache
+from pipeline import MatchingJobs
+
+
+def write_datasets(directory, suffix):
+    internal = os.path.join(directory, f'internal{suffix}.csv')
+    target = os.path.join(directory, f'target{suffix}.csv')
+    pd.DataFrame({
+        'Address': ['1 acacia street, bonfield', '2 koala road, epnew', f'3 oxley way, blackbon{suffix}'],
+        'First Name': ['sarah', 'john', 'mary'], 'Last Name': ['kelly', 'smith', 'young'],
+        'Mobile': [412000001, 412000002, 412000003],
+    }).to_csv(internal, index=False)
+    pd.DataFrame({
+        'Address': ['1 acacia st', '2 koala rd'], 'Suburb': ['bonfield', 'epnew'], "Owner's Name": ['kelly', 'smith'],
+    }).to_csv(target, index=False)
+    return internal, target
+
+
+def wait(jobs, job_id):
+    while jobs.status(job_id)['status'] in ('queued', 'running'):
+        time.sleep(0.05)
+    return jobs.status(job_id)
+
+
+def test_finished_results_are_reused_and_evicted(tmp_path):
+    jobs = MatchingJobs(str(tmp_path / 'results'), cache=LookupCache(str(tmp_path / 'cache')), max_bytes=1)
+    first = jobs.submit(*write_datasets(tmp_path, 'a'), output_format='csv', processes=1)
+    assert wait(jobs, first)['status'] == 'done'
+    assert jobs.submit(*write_datasets(tmp_path, 'a'), output_format='csv', processes=1) == first
+    assert jobs.status(first)['status'] == 'done'
+
+    # Over max_bytes only the job that finished last keeps its results
+    second = jobs.submit(*write_datasets(tmp_path, 'b'), output_format='csv', processes=1)
+    assert wait(jobs, second)['status'] == 'done'
+    assert jobs.status(first)['status'] == 'failed'
+    assert jobs.result(second)[0] is not None
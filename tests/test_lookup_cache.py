@@ -0,0 +1,24 @@
+import pandas as pd
+
+from Functions import LookupCache, load_lookup_dataset
+
+
+def test_first_run_returns_the_cached_data(tmp_path):
+    internal_path = str(tmp_path / 'internal.xlsx')
+    pd.DataFrame({
+        'Address': ['1 Acacia St', '2 Banksia Rd'],
+        'First Name': ['Ann', 'Ben'],
+        'Last Name': ['Smith', 'Jones'],
+        # An Excel number next to text, read as an object column
+        'Mobile': pd.Series([412000001, '0412 000 002'], dtype=object),
+        'Notes': ['not', 'cached'],
+    }).to_excel(internal_path, index=False)
+    # Smaller than any entry, so only the entry just written is kept
+    cache = LookupCache(str(tmp_path / 'cache'), max_bytes=1)
+
+    cold, key = load_lookup_dataset(internal_path, cache)
+    warm, warm_key = load_lookup_dataset(internal_path, cache)
+    assert key == warm_key
+    pd.testing.assert_frame_equal(cold, warm)
+    assert cold['Mobile'].tolist() == ['412000001', '0412 000 002']
+    assert 'Notes' not in cold.columns
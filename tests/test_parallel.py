@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from Functions import LookupCache, find_best_matches, find_best_matches_parallel, intern_lookup_dataset
+
+
+def test_workers_load_the_cached_lookup_dataset(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = 300
+    lookup = intern_lookup_dataset(pd.DataFrame({
+        'Address': [f"{rng.integers(1, 80)} street{rng.integers(0, 20)} road" for _ in range(rows)],
+        'Full Name': [f'name{i % 40}' for i in range(rows)],
+        'Last Name': [f'name{i % 40}' for i in range(rows)],
+        'Mobile': np.arange(rows) + 412000000,
+    }))
+    cache = LookupCache(str(tmp_path))
+    cache.save('key', lookup)
+    lookup = cache.load('key')
+    target = pd.DataFrame({'Address': lookup['Address'].astype(str).sample(40, random_state=1).str[:-1].tolist(),
+                           "Owner's Name": [f'name{i}' for i in range(40)]})
+
+    # The workers are not given the dataset, they memory-map it from the cache entry
+    parallel = find_best_matches_parallel(target, lookup.iloc[:0], processes=2, start_method='forkserver',
+                                          cache=cache, cache_key='key')
+    pd.testing.assert_frame_equal(parallel, find_best_matches(target, lookup))
@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from Functions import StageTimer, default_start_method
+
+
+pytestmark = pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason="RSS is sampled from /proc")
+
+
+def test_peak_rss_is_per_stage():
+    timer = StageTimer()
+    with timer.stage('allocate'):
+        block = np.ones(300 * 1024 ** 2, dtype=np.uint8)
+        del block
+    with timer.stage('small'):
+        pass
+    assert timer.stages['allocate']['peak_rss_mb'] - timer.stages['small']['peak_rss_mb'] > 250
+
+
+def allocate_in_worker(megabytes):
+    block = np.ones(megabytes * 1024 ** 2, dtype=np.uint8)
+    return int(block[-1])
+
+
+def test_peak_worker_rss_covers_workers_of_the_stage():
+    timer = StageTimer()
+    with timer.stage('matching'):
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            pool.map(allocate_in_worker, [200])
+    with timer.stage('finalize'):
+        pass
+    assert timer.stages['matching']['peak_worker_rss_mb'] > 200
+    assert timer.stages['finalize']['peak_worker_rss_mb'] is None
+
+
+def test_sampler_thread_does_not_prevent_fork():
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip("fork is not available")
+    with StageTimer().stage('matching'):
+        assert default_start_method() == 'fork'
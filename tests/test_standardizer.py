@@ -0,0 +1,135 @@
+import random
+import re
+
+import pandas as pd
+
+from Functions import ADDRESS_ABBREVIATIONS, AddressStandardizer, standardize_address
+
+
+# The original standardize_address, frozen: one re.sub per abbreviation, applied in order.
+# The single-pass AddressStandardizer must give exactly the same output.
+def sequential_standardize_address(address):
+    replacements = {
+        r'\bSt\b': 'street',
+        r'\bRd\b': 'road',
+        r'\bAve\b': 'avenue',
+        r'\bPl\b': 'place',
+        r'\bDr\b': 'drive',
+        r'\bLn\b': 'lane',
+        r'\bBlvd\b': 'boulevard',
+        r'\bCt\b': 'court',
+        r'\bAlly\b': 'alley',
+        r'\bAlwy\b': 'alleyway',
+        r'\bArc\b': 'arcade',
+        r'\bBasn\b': 'basin',
+        r'\bBch\b': 'beach',
+        r'\bBend\b': 'bend',
+        r'\bBlk\b': 'block',
+        r'\bBvd\b': 'boulevard',
+        r'\bBdge\b': 'bridge',
+        r'\bBdwy\b': 'broadway',
+        r'\bBypa\b': 'bypass',
+        r'\bBywy\b': 'byway',
+        r'\bCaus\b': 'causeway',
+        r'\bCn\b': 'central',
+        r'\bCtr\b': 'centre',
+        r'\bCnwy\b': 'centreway',
+        r'\bCh\b': 'chase',
+        r'\bCir\b': 'circle',
+        r'\bCct\b': 'circuit',
+        r'\bCl\b': 'close',
+        r'\bCon\b': 'concourse',
+        r'\bCnr\b': 'corner',
+        # Postal delivery type abbreviations
+        r'\bcare po\b': 'care Of Post Office',
+        r'\bcma\b': 'community Mail Agent',
+        r'\bcmb\b': 'community Mail Bag',
+        r'\bgpo box\b': 'general Post Office Box',
+        r'\blocked bag\b': 'locked Mail Bag Service',
+        r'\bms\b': 'mail Service',
+        r'\bpo box\b': 'post Office Box',
+        r'\bprivate bag\b': 'private mail bag service',
+        r'\brsd\b': 'roadside delivery',
+        r'\brmb\b': 'roadside mail bag',
+        r'\brms\b': 'roadside mail service',
+        r'\bcpa\b': 'community postal agent',
+        r'\bstrp\b': 'strip',
+        r'\bsbwy\b': 'subway',
+        r'\bthor\b': 'thoroughfare',
+        r'\btlwy\b': 'tollway',
+        r'\btwrs\b': 'towers',
+        r'\btrk\b': 'track',
+        r'\btrlr\b': 'trailer',
+        r'\btri\b': 'triangle',
+        r'\btkwy\b': 'trunkway',
+        r'\bturn\b': 'turn',
+        r'\bupas\b': 'underpass',
+        r'\bup\b': 'upper',
+        r'\bvale\b': 'vale',
+        r'\bvdct\b': 'viaduct',
+        r'\bvlls\b': 'villas',
+        r'\bvsta\b': 'vista',
+        r'\bwalk\b': 'walk',
+        r'\bwkyw\b': 'walkway',
+        r'\bw\b': 'west',
+        r'\bwhrf\b': 'wharf',
+        r'\bwynd\b': 'wynd',
+        r'\byard\b': 'yard',
+        r'\brch\b': 'reach',
+        r'\bres\b': 'reserve',
+        r'\brtt\b': 'retreat',
+        r'\brgwy\b': 'ridgeway',
+        r'\browy\b': 'right of Way',
+        r'\brvr\b': 'river',
+        r'\brvwy\b': 'riverway',
+        r'\brvra\b': 'riviera',
+        r'\brds\b': 'roads',
+        r'\brdwy\b': 'roadway',
+        r'\brnde\b': 'ronde',
+        r'\brsbl\b': 'rosebowl',
+        r'\brty\b': 'rotary',
+        r'\brnd\b': 'round',
+        r'\brte\b': 'route',
+        r'\brun\b': 'run',
+        r'\bswy\b': 'service way',
+        r'\bsdng\b': 'siding',
+        r'\bslpe\b': 'slope',
+        r'\bsnd\b': 'sound'
+
+    }
+
+    # Use regex to perform replacements only where the whole word matches
+    for old, new in replacements.items():
+        address = re.sub(old, new, address, flags=re.IGNORECASE)
+
+    return address
+
+
+def address_corpus(size=5000, seed=0):
+    rng = random.Random(seed)
+    words = list(ADDRESS_ABBREVIATIONS) + list(ADDRESS_ABBREVIATIONS.values()) + [
+        'george', 'acacia', 'st kilda', 'stanley', 'drive-in', 'o\'connell', '12', '3/51', 'unit', 'u4',
+    ]
+    separators = [' ', ' ', ' ', ', ', '-', '.', '/', '']
+    corpus = []
+    for _ in range(size):
+        parts = []
+        for _ in range(rng.randint(1, 6)):
+            word = rng.choice(words)
+            word = rng.choice([word, word.lower(), word.upper(), word.title()])
+            parts.append(word + rng.choice(separators))
+        corpus.append(''.join(parts).strip())
+    return corpus
+
+
+def test_single_pass_standardizer_matches_sequential_substitutions():
+    standardizer = AddressStandardizer()
+    for address in address_corpus():
+        assert standardizer.standardize(address) == sequential_standardize_address(address), address
+
+
+def test_standardize_series_matches_per_address():
+    addresses = pd.Series(address_corpus(2000, seed=1) + [None])
+    standardized = AddressStandardizer().standardize_series(addresses)
+    assert standardized.iloc[:-1].tolist() == [standardize_address(address) for address in addresses.iloc[:-1]]
+    assert standardized.isna().iloc[-1]
@@ -0,0 +1,42 @@
+import pandas as pd
+
+from Functions import LookupCache
+from pipeline import run_address_matching
+
+
+def write_datasets(tmp_path):
+    internal = pd.DataFrame({
+        'Address': ['1 Acacia St', '2 Banksia Rd', '3 Church Ave', '4 George St', '5 Koala Cl', '6 Oxley Rd'],
+        'Suburb': ['Bonfield'] * 6,
+        'First Name': ['Ann', 'Ben', 'Cat', 'Dan', 'Eve', 'Fay'],
+        'Last Name': ['Smith', 'Jones', 'Kelly', 'Roberts', 'Patel', 'Young'],
+        'Mobile': [412000001, 412000002, 412000003, 412000004, 412000005, 412000006],
+    })
+    internal_path = tmp_path / 'internal.csv'
+    internal.to_csv(internal_path, index=False)
+    # With chunk_size=2 the second chunk has only blank owner's names and the third only blank suburbs
+    target_path = tmp_path / 'target.csv'
+    target_path.write_text(
+        "Address,Suburb,Owner's Name\n"
+        "1 Acacia St,Bonfield,Ann Smith\n"
+        "2 Banksia Rd,Bonfield,Ben Jones\n"
+        "3 Church Ave,Bonfield,\n"
+        "4 George St,Bonfield,\n"
+        "5 Koala Cl,,Eve Patel\n"
+        "6 Oxley Rd,,Fay Young\n"
+    )
+    return str(internal_path), str(target_path)
+
+
+def test_streaming_csv_chunk_with_blank_text_columns(tmp_path):
+    internal_path, target_path = write_datasets(tmp_path)
+    cache = LookupCache(str(tmp_path / 'cache'))
+    output = str(tmp_path / 'results.csv')
+    rows = run_address_matching(internal_path, target_path, output=output, output_format='csv', streaming=True,
+                                chunk_size=2, cache=cache)
+    assert rows == 6
+    streamed = pd.read_csv(output, dtype=str)
+    in_memory = run_address_matching(internal_path, target_path, cache=cache).sort_index()
+    columns = ['Best Match Address', 'Best Match Name', 'Confidence']
+    assert streamed[columns].fillna('').values.tolist() == in_memory[columns].fillna('').values.tolist()
+    assert streamed['Best Match Address'].tolist()[2:4] == ['3 church avenue', '4 george street']